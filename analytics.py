@@ -0,0 +1,166 @@
+"""
+Daily application rollups behind the organization dashboard's analytics
+
+Each application adds one to its opportunity's row for the day it was
+submitted, and each accept or reject to the row for the day it was decided,
+along with how long the decision took. seats.py makes these changes in the
+same transaction as the status change, so a month of trends is read from
+at most one row per opportunity and day instead of the application
+history. `flask --app app rebuildanalytics` recomputes every row from the
+live and archived applications. Days are UTC, like applied_at.
+"""
+
+from collections import defaultdict
+from datetime import timedelta
+from sqlalchemy import delete, func, insert, select, update
+from models import (db, Opportunity, Application, ArchivedOpportunity, ArchivedApplication,
+                    ApplicationDailyStats, SchemaVersion)
+
+# Statuses that are an organization's decision
+DECIDED = ('accepted', 'rejected')
+COUNTERS = ('applications', 'accepted', 'rejected', 'timed_decisions', 'decision_seconds')
+
+
+def _new_deltas():
+    """{(opportunity_id, day, org_id): {counter: change}}"""
+    return defaultdict(lambda: dict.fromkeys(COUNTERS, 0))
+
+
+def _count_decision(deltas, opp_id, org_id, applied_at, status, decided_at, sign=1):
+    """Add (sign=1) or take back (sign=-1) one decision"""
+    # Decisions made before decided_at was recorded count on the applied day
+    day = decided_at or applied_at
+    if day is None:
+        return
+    counters = deltas[(opp_id, day.date(), org_id)]
+    counters[status] += sign
+    if decided_at is not None and applied_at is not None:
+        counters['timed_decisions'] += sign
+        counters['decision_seconds'] += sign * int((decided_at - applied_at).total_seconds())
+
+
+def _rows(deltas):
+    # In key order, so concurrent transactions lock rows in the same order
+    return [{'opportunity_id': opp_id, 'day': day, 'org_id': org_id, **counters}
+            for (opp_id, day, org_id), counters in sorted(deltas.items()) if any(counters.values())]
+
+
+def _add(deltas):
+    """Add the changes to their rows, creating the missing ones (caller commits)"""
+    rows = _rows(deltas)
+    if not rows:
+        return
+    table = ApplicationDailyStats.__table__
+    dialect = db.session.get_bind().dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert as upsert
+        else:
+            from sqlalchemy.dialects.postgresql import insert as upsert
+        statement = upsert(table)
+        statement = statement.on_conflict_do_update(
+            index_elements=[table.c.opportunity_id, table.c.day],
+            set_={name: table.c[name] + statement.excluded[name] for name in COUNTERS}
+        )
+    elif dialect in ('mysql', 'mariadb'):
+        from sqlalchemy.dialects.mysql import insert as upsert
+        statement = upsert(table)
+        statement = statement.on_duplicate_key_update(
+            {name: table.c[name] + statement.inserted[name] for name in COUNTERS}
+        )
+    else:
+        for row in rows:
+            result = db.session.execute(
+                update(table)
+                .where(table.c.opportunity_id == row['opportunity_id'], table.c.day == row['day'])
+                .values({name: table.c[name] + row[name] for name in COUNTERS})
+            )
+            if result.rowcount == 0:
+                db.session.execute(insert(table).values(row))
+        return
+    db.session.execute(statement, rows)
+
+
+def record_application(opp_id, org_id, applied_at):
+    """Count a new application (caller commits)"""
+    deltas = _new_deltas()
+    deltas[(opp_id, applied_at.date(), org_id)]['applications'] += 1
+    _add(deltas)
+
+
+def record_decisions(decisions, decided_at):
+    """
+    Count accept and reject decisions made at decided_at (caller commits).
+    `decisions` are (opportunity_id, org_id, applied_at, old status, old
+    decided_at, new status); a changed decision is taken back from the day
+    it was counted on.
+    """
+    deltas = _new_deltas()
+    for opp_id, org_id, applied_at, old_status, old_decided_at, status in decisions:
+        if old_status in DECIDED:
+            _count_decision(deltas, opp_id, org_id, applied_at, old_status, old_decided_at, sign=-1)
+        _count_decision(deltas, opp_id, org_id, applied_at, status, decided_at)
+    _add(deltas)
+
+
+def rebuild(batch_size=1000):
+    """Recompute every row from the live and archived applications (caller commits). Returns the row count."""
+    deltas = _new_deltas()
+    for application, opportunity in ((Application, Opportunity), (ArchivedApplication, ArchivedOpportunity)):
+        rows = db.session.execute(
+            select(application.opportunity_id, opportunity.org_id, application.applied_at,
+                   application.status, application.decided_at)
+            .join(opportunity, application.opportunity_id == opportunity.id)
+            .execution_options(yield_per=batch_size)
+        )
+        for opp_id, org_id, applied_at, status, decided_at in rows:
+            if applied_at is not None:
+                deltas[(opp_id, applied_at.date(), org_id)]['applications'] += 1
+            if status in DECIDED:
+                _count_decision(deltas, opp_id, org_id, applied_at, status, decided_at)
+
+    db.session.execute(delete(ApplicationDailyStats))
+    rows = _rows(deltas)
+    for start in range(0, len(rows), batch_size):
+        db.session.execute(insert(ApplicationDailyStats), rows[start:start + batch_size])
+    return len(rows)
+
+
+@SchemaVersion.upgrade('analytics-rollups')
+def rebuild_existing():
+    """Roll up the applications made before the rollups existed"""
+    rebuild()
+    db.session.commit()
+
+
+def _rates(row):
+    """Acceptance rate (%) and average hours to a decision, None without data"""
+    decisions = row['accepted'] + row['rejected']
+    row['acceptance_rate'] = 100 * row['accepted'] / decisions if decisions else None
+    row['decision_hours'] = (row['decision_seconds'] / row['timed_decisions'] / 3600
+                             if row['timed_decisions'] else None)
+    return row
+
+
+def summary(org_id, today, days=30, top=10):
+    """
+    An organization's last `days` days from the rollups: totals, a row per
+    day, and the `top` opportunities by applications
+    """
+    since = today - timedelta(days=days - 1)
+    S = ApplicationDailyStats
+    sums = [func.coalesce(func.sum(getattr(S, name)), 0).label(name) for name in COUNTERS]
+
+    by_day = {row.day: row._asdict() for row in db.session.execute(
+        select(S.day, *sums).where(S.org_id == org_id, S.day >= since).group_by(S.day)
+    )}
+    trend = [by_day.get(since + timedelta(days=n)) or {'day': since + timedelta(days=n), **dict.fromkeys(COUNTERS, 0)}
+             for n in range(days)]
+    totals = _rates({name: sum(row[name] for row in trend) for name in COUNTERS})
+
+    opportunities = [_rates(row._asdict()) for row in db.session.execute(
+        select(S.opportunity_id, *sums).where(S.org_id == org_id, S.day >= since)
+        .group_by(S.opportunity_id).order_by(func.sum(S.applications).desc(), S.opportunity_id.desc()).limit(top)
+    )]
+    peak = max(row['applications'] for row in trend)
+    return {'days': days, 'totals': totals, 'trend': trend, 'peak': peak, 'opportunities': opportunities}
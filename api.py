@@ -0,0 +1,294 @@
+"""
+Versioned JSON API for mobile and partner clients
+
+Responses contain only the requested fields (?fields=id,title) and only
+those columns are loaded, so large columns like description and bio are
+never read unless asked for. Lists use cursor pagination and accept
+?ids=1,2,3 to fetch a batch of records at once.
+"""
+
+from flask import Blueprint, current_app, jsonify, request
+from flask_login import current_user
+from sqlalchemy import or_
+from sqlalchemy.orm import load_only
+from models import db, User, Opportunity, Application, ArchivedOpportunity, ArchivedApplication
+from queries import (application_status_counts, archived_status_counts, parse_cursor, make_cursor,
+                     browse_filters, browse_open_opportunities)
+import seats
+import notifications
+import geo
+
+api = Blueprint('api_v1', __name__, url_prefix='/api/v1')
+
+MAX_LIMIT = 100
+# Applications per bulk status update
+MAX_BULK_UPDATE = 500
+
+# Fields each resource can return, and the ones returned when ?fields is omitted
+OPPORTUNITY_FIELDS = ('id', 'title', 'description', 'location', 'date', 'duration', 'skills_required',
+                      'spots_available', 'status', 'created_at', 'org_id')
+OPPORTUNITY_DEFAULT_FIELDS = ('id', 'title', 'location', 'date', 'spots_available', 'status', 'org_id')
+APPLICATION_FIELDS = ('id', 'message', 'status', 'applied_at', 'user_id', 'opportunity_id')
+APPLICATION_DEFAULT_FIELDS = ('id', 'status', 'applied_at', 'user_id', 'opportunity_id')
+# Email and phone are only visible through the dashboard pages
+USER_FIELDS = ('id', 'name', 'role', 'location', 'bio', 'created_at')
+USER_DEFAULT_FIELDS = ('id', 'name', 'role', 'location')
+
+
+class APIError(Exception):
+    """Error returned to the client as {"error": message}"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+@api.errorhandler(APIError)
+def handle_api_error(error):
+    return jsonify(error=error.message), error.status
+
+
+def requested_fields(allowed, default):
+    """Fields selected with ?fields=, always including id"""
+    value = request.args.get('fields')
+    if not value:
+        return list(default)
+    fields = [field.strip() for field in value.split(',') if field.strip()]
+    unknown = sorted(set(fields) - set(allowed))
+    if unknown:
+        raise APIError(f'Unknown fields: {", ".join(unknown)}')
+    return ['id'] + [field for field in dict.fromkeys(fields) if field != 'id']
+
+
+def requested_ids():
+    """IDs selected with ?ids= for a batch fetch, or None"""
+    value = request.args.get('ids')
+    if not value:
+        return None
+    try:
+        ids = [int(part) for part in value.split(',') if part.strip()]
+    except ValueError:
+        raise APIError('ids must be a comma-separated list of integers')
+    if len(ids) > MAX_LIMIT:
+        raise APIError(f'At most {MAX_LIMIT} ids per request')
+    return ids
+
+
+def requested_limit():
+    return min(max(request.args.get('limit', 20, type=int), 1), MAX_LIMIT)
+
+
+def columns(model, fields, *extra):
+    """load_only() option for the selected fields (plus any needed for paging)"""
+    return load_only(*(getattr(model, name) for name in dict.fromkeys([*fields, *extra])))
+
+
+def serialize(obj, fields):
+    data = {}
+    for field in fields:
+        value = getattr(obj, field)
+        data[field] = value.isoformat() if hasattr(value, 'isoformat') else value
+    return data
+
+
+def by_ids(model, ids, fields, *criteria):
+    """Batch fetch in the order the IDs were given (missing ones are skipped)"""
+    rows = model.query.options(columns(model, fields)).filter(model.id.in_(ids), *criteria).all()
+    found = {row.id: row for row in rows}
+    return jsonify(data=[serialize(found[i], fields) for i in ids if i in found])
+
+
+def require_login():
+    if not current_user.is_authenticated:
+        raise APIError('Authentication required', 401)
+
+
+@api.route('/opportunities')
+def list_opportunities():
+    """Open opportunities in date order, with the browse page filters"""
+    fields = requested_fields(OPPORTUNITY_FIELDS, OPPORTUNITY_DEFAULT_FIELDS)
+    ids = requested_ids()
+    if ids is not None:
+        return by_ids(Opportunity, ids, fields)
+
+    try:
+        cursor = parse_cursor(request.args['cursor']) if request.args.get('cursor') else None
+    except ValueError:
+        raise APIError('Invalid cursor')
+    limit = requested_limit()
+
+    page = browse_open_opportunities(
+        browse_filters(), cursor, limit + 1, options=[columns(Opportunity, fields, 'date')]
+    )
+    next_cursor = make_cursor(page[limit - 1]) if len(page) > limit else None
+    return jsonify(data=[serialize(opp, fields) for opp in page[:limit]], next_cursor=next_cursor)
+
+
+@api.route('/opportunities/<int:opp_id>')
+def get_opportunity(opp_id):
+    fields = requested_fields(OPPORTUNITY_FIELDS, OPPORTUNITY_FIELDS)
+    opportunity = Opportunity.query.options(columns(Opportunity, fields)).filter_by(id=opp_id).first()
+    if opportunity is None:
+        raise APIError('Opportunity not found', 404)
+    return jsonify(data=serialize(opportunity, fields))
+
+
+@api.route('/opportunities/near')
+def opportunities_near():
+    """
+    Open opportunities within ?radius= km (default 25) of ?lat=&lon= or of
+    a place (?near=Austin, TX), nearest first, with their distance_km
+    """
+    fields = requested_fields(OPPORTUNITY_FIELDS, OPPORTUNITY_DEFAULT_FIELDS)
+    lat = request.args.get('lat', type=float)
+    lon = request.args.get('lon', type=float)
+    if lat is not None and lon is not None:
+        if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+            raise APIError('lat/lon out of range')
+        coordinates = (lat, lon)
+    elif request.args.get('near'):
+        coordinates = geo.geocode(request.args['near'])
+        if coordinates is None:
+            raise APIError('Unknown place', 404)
+    else:
+        raise APIError('lat and lon (or near) are required')
+
+    radius = request.args.get('radius', geo.DEFAULT_RADIUS_KM, type=float)
+    if not 0 < radius <= geo.MAX_RADIUS_KM:
+        raise APIError(f'radius must be between 0 and {geo.MAX_RADIUS_KM} km')
+    limit = requested_limit()
+    offset = max(request.args.get('offset', 0, type=int), 0)
+
+    results, total = geo.opportunities_near(*coordinates, radius, limit=limit, offset=offset)
+    return jsonify(
+        data=[{**serialize(opp, fields), 'distance_km': round(distance, 2)} for opp, distance in results],
+        total=total
+    )
+
+
+@api.route('/users')
+def list_users():
+    """
+    Profiles fetched in batches by ID: any organization, the logged-in user
+    and, for an organization, the volunteers who applied to its
+    opportunities (other IDs are skipped)
+    """
+    require_login()
+    fields = requested_fields(USER_FIELDS, USER_DEFAULT_FIELDS)
+    ids = requested_ids()
+    if ids is None:
+        raise APIError('ids is required')
+
+    visible = [User.role == 'organization', User.id == current_user.id]
+    if current_user.role == 'organization':
+        visible.append(User.id.in_(
+            db.session.query(Application.user_id).join(Opportunity)
+            .filter(Opportunity.org_id == current_user.id)
+        ))
+        visible.append(User.id.in_(
+            db.session.query(ArchivedApplication.user_id)
+            .join(ArchivedOpportunity, ArchivedApplication.opportunity_id == ArchivedOpportunity.id)
+            .filter(ArchivedOpportunity.org_id == current_user.id)
+        ))
+    return by_ids(User, ids, fields, or_(*visible))
+
+
+@api.route('/applications')
+def list_applications():
+    """
+    The logged-in volunteer's applications, or the applications to the
+    logged-in organization's opportunities, newest first
+    """
+    require_login()
+    fields = requested_fields(APPLICATION_FIELDS, APPLICATION_DEFAULT_FIELDS)
+
+    if current_user.role == 'organization':
+        owned = Application.opportunity_id.in_(
+            db.session.query(Opportunity.id).filter(Opportunity.org_id == current_user.id)
+        )
+    else:
+        owned = Application.user_id == current_user.id
+
+    ids = requested_ids()
+    if ids is not None:
+        return by_ids(Application, ids, fields, owned)
+
+    query = Application.query.options(columns(Application, fields)).filter(owned)
+    if request.args.get('status'):
+        query = query.filter(Application.status == request.args['status'])
+    if request.args.get('opportunity_id', type=int):
+        query = query.filter(Application.opportunity_id == request.args.get('opportunity_id', type=int))
+
+    # Keyset pagination on the ID, newest first
+    cursor = request.args.get('cursor', type=int)
+    if cursor:
+        query = query.filter(Application.id < cursor)
+    limit = requested_limit()
+    page = query.order_by(Application.id.desc()).limit(limit + 1).all()
+    next_cursor = page[limit - 1].id if len(page) > limit else None
+    return jsonify(data=[serialize(app, fields) for app in page[:limit]], next_cursor=next_cursor)
+
+
+@api.route('/applications/bulk-update', methods=['POST'])
+def bulk_update_applications():
+    """
+    Accept or reject a batch of the logged-in organization's applications.
+    Takes {"ids": [...], "action": "accept" | "reject"} and returns only the
+    applications whose status changed (IDs it doesn't own are ignored).
+    """
+    require_login()
+    if current_user.role != 'organization':
+        raise APIError('Only organizations can update applications', 403)
+
+    payload = request.get_json(silent=True) or {}
+    action = payload.get('action')
+    ids = payload.get('ids')
+    if action not in ('accept', 'reject'):
+        raise APIError('action must be "accept" or "reject"')
+    if not isinstance(ids, list) or not all(isinstance(i, int) and not isinstance(i, bool) for i in ids):
+        raise APIError('ids must be a list of integers')
+    if len(ids) > MAX_BULK_UPDATE:
+        raise APIError(f'At most {MAX_BULK_UPDATE} ids per request')
+
+    org_id = current_user.id
+    # End the read transaction so the updates run as one short write transaction
+    db.session.commit()
+    changed = seats.decide_many(org_id, list(dict.fromkeys(ids)), action)
+    # Volunteers promoted from the waitlist show up as pending
+    for status, event in (('accepted', 'accepted'), ('rejected', 'rejected'), ('pending', 'promoted')):
+        notifications.notify(event, [app_id for app_id, (_, new_status) in changed.items() if new_status == status])
+    db.session.commit()
+    if changed:
+        current_app.extensions['page_cache'].invalidate()
+
+    return jsonify(data=[
+        {'id': app_id, 'opportunity_id': opp_id, 'status': status}
+        for app_id, (opp_id, status) in sorted(changed.items())
+    ])
+
+
+@api.route('/dashboard')
+def dashboard():
+    """The dashboard statistics of the logged-in user (archived history included)"""
+    require_login()
+    if current_user.role == 'organization':
+        status_counts = application_status_counts(Opportunity.org_id == current_user.id)
+        archived_counts = archived_status_counts(ArchivedOpportunity.org_id == current_user.id)
+        opportunity_count = db.session.query(db.func.count(Opportunity.id)).filter(
+            Opportunity.org_id == current_user.id
+        ).scalar() + db.session.query(db.func.count(ArchivedOpportunity.id)).filter(
+            ArchivedOpportunity.org_id == current_user.id
+        ).scalar()
+        data = {'opportunities': opportunity_count}
+    else:
+        status_counts = application_status_counts(Application.user_id == current_user.id)
+        archived_counts = archived_status_counts(ArchivedApplication.user_id == current_user.id)
+        data = {}
+    data['applications'] = {
+        'total': sum(status_counts.values()) + sum(archived_counts.values()),
+        **{status: status_counts.get(status, 0) + archived_counts.get(status, 0)
+           for status in ('pending', 'accepted', 'rejected', 'waitlisted')},
+    }
+    return jsonify(data=data)
+
@@ -0,0 +1,176 @@
+"""
+Fingerprinted, precompressed static assets and compressed HTML responses
+
+`flask --app app buildassets` copies every file under static/ to
+static/dist/ with a hash of its contents in the name (css/style.css becomes
+css/style.<hash>.css), next to gzip and brotli variants, and records the
+names in static/dist/manifest.json. Templates link assets with
+asset_url('css/style.css'), which takes the same arguments as
+url_for('static', filename=...) and returns the fingerprinted URL once
+the assets are built. Fingerprinted files never change, so they are
+served with far-future cache headers and the smallest variant the client
+accepts. Without a build, asset_url falls back to the plain static URL.
+
+HTML and JSON responses of at least COMPRESS_MIN_SIZE bytes are gzipped
+when the client accepts it.
+"""
+
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+from flask import request, send_from_directory, url_for
+
+BUILD_DIR = 'dist'
+MANIFEST = 'manifest.json'
+# Extensions worth compressing (images and fonts are already compressed)
+COMPRESSIBLE = ('.css', '.js', '.mjs', '.map', '.json', '.svg', '.txt', '.xml', '.html', '.ico')
+# Smaller files gain less than the extra request headers cost
+MIN_COMPRESS_SIZE = 256
+# Content-Encoding, file suffix, in order of preference
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+def _compressors():
+    """(encoding, suffix, compress) for each available encoder, at maximum effort"""
+    compressors = []
+    try:
+        import brotli
+    except ImportError:
+        pass
+    else:
+        compressors.append(('br', '.br', lambda data: brotli.compress(data, quality=11)))
+    compressors.append(('gzip', '.gz', lambda data: gzip.compress(data, compresslevel=9, mtime=0)))
+    return compressors
+
+
+def _write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def build(static_folder, clean=False):
+    """
+    Fingerprint and compress every static file into static/dist and write
+    the manifest. Earlier builds are kept (pages cached before a deploy may
+    still link them) unless `clean` is set. Returns the manifest.
+    """
+    build_dir = os.path.join(static_folder, BUILD_DIR)
+    keep = set()
+    compressors = _compressors()
+    manifest = {'files': {}, 'encodings': {}}
+
+    for root, dirs, names in os.walk(static_folder):
+        dirs[:] = sorted(name for name in dirs if os.path.join(root, name) != build_dir)
+        for name in sorted(names):
+            source = os.path.join(root, name)
+            logical = os.path.relpath(source, static_folder).replace(os.sep, '/')
+            with open(source, 'rb') as f:
+                data = f.read()
+            stem, ext = os.path.splitext(logical)
+            fingerprinted = f'{stem}.{hashlib.sha256(data).hexdigest()[:12]}{ext}'
+            target = os.path.join(build_dir, fingerprinted)
+            _write(target, data)
+            keep.add(target)
+            manifest['files'][logical] = fingerprinted
+
+            if ext.lower() not in COMPRESSIBLE or len(data) < MIN_COMPRESS_SIZE:
+                continue
+            for encoding, suffix, compress in compressors:
+                compressed = compress(data)
+                if len(compressed) < len(data):
+                    _write(target + suffix, compressed)
+                    keep.add(target + suffix)
+                    manifest['encodings'].setdefault(fingerprinted, []).append(encoding)
+
+    if clean:
+        for root, _, names in os.walk(build_dir):
+            for name in names:
+                path = os.path.join(root, name)
+                if path not in keep and name != MANIFEST:
+                    os.remove(path)
+
+    # Write the manifest last so a running app never links a missing file
+    _write(os.path.join(build_dir, MANIFEST + '.tmp'), json.dumps(manifest, indent=2, sort_keys=True).encode())
+    os.replace(os.path.join(build_dir, MANIFEST + '.tmp'), os.path.join(build_dir, MANIFEST))
+    return manifest
+
+
+class Assets:
+    """Links and serves built assets, and compresses large text responses"""
+
+    def __init__(self, app=None):
+        self.files = {}
+        self.encodings = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.build_dir = os.path.join(app.static_folder, BUILD_DIR)
+        self.max_age = app.config.get('ASSET_MAX_AGE', 31536000)
+        self.compress_min_size = app.config.get('COMPRESS_MIN_SIZE', 1024)
+        self.compress_level = app.config.get('COMPRESS_LEVEL', 6)
+        self.compress_mimetypes = set(app.config.get('COMPRESS_MIMETYPES', ('text/html', 'application/json')))
+        self.load_manifest()
+
+        # More specific than the /static/<path:filename> rule, so it wins
+        app.add_url_rule(f'{app.static_url_path}/{BUILD_DIR}/<path:filename>', 'asset', self.send_asset)
+        app.add_template_global(self.url_for, 'asset_url')
+        if app.config.get('COMPRESS_RESPONSES', True):
+            app.after_request(self.compress_response)
+        app.extensions['assets'] = self
+
+    def load_manifest(self):
+        """Read the last build's manifest, if there is one"""
+        try:
+            with open(os.path.join(self.build_dir, MANIFEST)) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            manifest = {}
+        self.files = manifest.get('files', {})
+        self.encodings = manifest.get('encodings', {})
+
+    def url_for(self, filename, **values):
+        """URL of a static file, fingerprinted when the assets are built"""
+        fingerprinted = self.files.get(filename)
+        if fingerprinted is None:
+            return url_for('static', filename=filename, **values)
+        return url_for('asset', filename=fingerprinted, **values)
+
+    def send_asset(self, filename):
+        """Serve a fingerprinted file, precompressed when the client accepts it"""
+        available = self.encodings.get(filename, ())
+        encoding = next((encoding for encoding, _ in ENCODINGS
+                         if encoding in available and request.accept_encodings[encoding]), None)
+        suffix = dict(ENCODINGS).get(encoding, '')
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        response = send_from_directory(self.build_dir, filename + suffix, mimetype=mimetype,
+                                       max_age=self.max_age)
+        if encoding:
+            response.content_encoding = encoding
+        if available:
+            response.vary.add('Accept-Encoding')
+        # The name changes whenever the contents do, so never revalidate
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        return response
+
+    def compress_response(self, response):
+        """Gzip a large HTML or JSON response for clients that accept it"""
+        if (response.mimetype not in self.compress_mimetypes or response.status_code != 200
+                or response.direct_passthrough or response.is_streamed):
+            return response
+        response.vary.add('Accept-Encoding')
+        if ('Content-Encoding' in response.headers or not request.accept_encodings['gzip']
+                or (response.calculate_content_length() or 0) < self.compress_min_size):
+            return response
+
+        response.set_data(gzip.compress(response.get_data(), compresslevel=self.compress_level, mtime=0))
+        response.content_encoding = 'gzip'
+        # The bytes differ from the uncompressed page; a weak ETag still gets 304s
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
@@ -0,0 +1,93 @@
+"""
+Micro-benchmark for login throughput and page latency during a login storm
+
+Runs the same burst of concurrent logins with password hashing in the
+request thread (PASSWORD_HASH_WORKERS=0) and in the process pool, while
+another thread keeps requesting a cheap page. The page cache is off, so
+that page is rendered by a request thread every time.
+
+Usage: python benchmarks/login_throughput.py [--logins 200] [--threads 16] [--workers 4]
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Use a throwaway database before the app reads its config
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+# A cached page would be answered without waiting for a request thread's CPU time
+os.environ['CACHE_TYPE'] = 'null'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app, db, password_hasher  # noqa: E402
+from models import User  # noqa: E402
+
+EMAIL = 'bench@example.com'
+PASSWORD = 'benchmark-password'
+
+
+def setup():
+    app.config.update(WTF_CSRF_ENABLED=False, TESTING=True)
+    with app.app_context():
+        db.create_all()
+        user = User(name='Bench User', email=EMAIL, role='volunteer')
+        user.set_password(PASSWORD)
+        db.session.add(user)
+        db.session.commit()
+
+
+def run(workers, logins, threads):
+    app.config['PASSWORD_HASH_WORKERS'] = workers
+    app.config['PASSWORD_HASH_QUEUE_LIMIT'] = 0  # Measure throughput, don't shed load
+    password_hasher.init_app(app)
+
+    def login(_):
+        response = app.test_client().post('/login', data={'email': EMAIL, 'password': PASSWORD})
+        assert response.status_code == 302, response.status_code
+
+    page_latencies = []
+    done = threading.Event()
+
+    def browse():
+        client = app.test_client()
+        while not done.is_set():
+            start = time.perf_counter()
+            client.get('/opportunities')
+            page_latencies.append(time.perf_counter() - start)
+
+    browser = threading.Thread(target=browse)
+    browser.start()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(login, range(logins)))
+    elapsed = time.perf_counter() - start
+    done.set()
+    browser.join()
+
+    page_latencies.sort()
+    p95 = page_latencies[int(len(page_latencies) * 0.95) - 1] if page_latencies else 0.0
+    label = f'{workers} hashing processes' if workers else 'request thread'
+    print(f'{label:>22}: {logins / elapsed:8.1f} logins/s | '
+          f'page p50 {statistics.median(page_latencies) * 1000:7.1f} ms, p95 {p95 * 1000:7.1f} ms')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--logins', type=int, default=200)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 2)
+    args = parser.parse_args()
+
+    setup()
+    print(f'{args.logins} logins from {args.threads} threads, method {app.config["PASSWORD_HASH_METHOD"]}')
+    run(0, args.logins, args.threads)
+    run(args.workers, args.logins, args.threads)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,244 @@
+"""
+Route-level benchmark with SQL query-count and latency budgets
+
+Boots the app against a generated dataset, drives every route through the
+Flask test client (first one request at a time, then from concurrent
+threads), reports p50/p95/p99 latency and throughput per route, and exits
+non-zero when a route issues more SQL queries than its budget or its
+sequential p95 latency exceeds its budget.
+
+Usage: python benchmarks/routes.py [--users 2000] [--opportunities 10000]
+           [--applications 50000] [--requests 50] [--concurrency 8]
+           [--database sqlite:////path/to/existing.db]
+"""
+
+import argparse
+import itertools
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+# Parse options and pick the database before the app reads its config
+parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+parser.add_argument('--users', type=int, default=2000)
+parser.add_argument('--opportunities', type=int, default=10000)
+parser.add_argument('--applications', type=int, default=50000)
+parser.add_argument('--requests', type=int, default=50, help='Requests per route and phase')
+parser.add_argument('--concurrency', type=int, default=8, help='Threads in the concurrent phase')
+parser.add_argument('--database', help='Use an existing (generated) database instead of a new one')
+parser.add_argument('--cache', action='store_true', help='Keep the anonymous page cache enabled')
+args = parser.parse_args()
+
+os.environ['DATABASE_URL'] = args.database or 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+if not args.cache:
+    os.environ['CACHE_TYPE'] = 'null'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event, func, select  # noqa: E402
+from app import app, db  # noqa: E402
+from models import User, Opportunity, Application  # noqa: E402
+import bulkdata  # noqa: E402
+import geo  # noqa: E402
+import search  # noqa: E402
+import skills  # noqa: E402
+import analytics  # noqa: E402
+
+PASSWORD = 'password123'
+
+# client: which logged-in user makes the request ('anonymous', 'volunteer',
+# 'applicant' or 'organization'); request: builds (method, url, form data)
+# from the benchmark context; budgets are per request. Logged-in routes allow
+# one extra query for loading the user when the identity cache misses.
+Route = namedtuple('Route', 'name client request max_queries p95_ms')
+
+ROUTES = [
+    Route('index', 'anonymous', lambda ctx: ('GET', '/', None), 2, 50),
+    Route('opportunities', 'anonymous', lambda ctx: ('GET', '/opportunities', None), 1, 50),
+    Route('opportunities (filtered)', 'anonymous',
+          lambda ctx: ('GET', f'/opportunities?location=Austin&org_id={ctx["org_id"]}', None), 1, 50),
+    Route('search', 'anonymous', lambda ctx: ('GET', '/search?q=food+volunteer', None), 2, 100),
+    Route('opportunities_near', 'anonymous',
+          lambda ctx: ('GET', '/opportunities/near?near=Austin,+TX&radius=50', None), 3, 100),
+    Route('opportunity_detail', 'anonymous',
+          lambda ctx: ('GET', f'/opportunity/{next(ctx["detail_ids"])}', None), 2, 50),
+    Route('opportunity_detail (volunteer)', 'volunteer',
+          lambda ctx: ('GET', f'/opportunity/{next(ctx["detail_ids"])}', None), 4, 50),
+    Route('volunteer_dashboard', 'volunteer', lambda ctx: ('GET', '/volunteer/dashboard', None), 7, 100),
+    Route('org_dashboard', 'organization', lambda ctx: ('GET', '/organization/dashboard', None), 8, 500),
+    # Joining the waitlist of a full listing also reads whether it is still open
+    Route('apply', 'applicant',
+          lambda ctx: ('POST', f'/apply/{next(ctx["apply_ids"])}',
+                       {'message': 'I would love to help out and have relevant experience.'}), 6, 100),
+    Route('update_application', 'organization',
+          lambda ctx: ('POST', f'/application/{next(ctx["pending_ids"])}/update', {'action': 'accept'}), 5, 100),
+    Route('login', 'anonymous',
+          lambda ctx: ('POST', '/login', {'email': ctx['volunteer_email'], 'password': PASSWORD}), 2, 1000),
+]
+
+# Queries issued by the request running on the current thread
+_queries = threading.local()
+
+
+def count_query(*_):
+    _queries.count = getattr(_queries, 'count', 0) + 1
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, int(round(pct / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def prepare(total_requests):
+    """Generate the dataset (unless reusing one) and pick the benchmark accounts"""
+    app.config.update(WTF_CSRF_ENABLED=False, TESTING=True)
+    with app.app_context():
+        db.create_all()
+        if not args.database:
+            geo.ensure_places()
+            db.session.commit()
+            bulkdata.generate(args.users, args.opportunities, args.applications, seed=42,
+                              progress=lambda message: None)
+            search.rebuild_index()
+            skills.rebuild_opportunity_skills()
+            analytics.rebuild()
+            db.session.commit()
+
+        # The busiest organization and volunteer represent our large accounts
+        org_id = db.session.execute(
+            select(Opportunity.org_id).join(Application)
+            .where(Application.status == 'pending')
+            .group_by(Opportunity.org_id).order_by(func.count().desc()).limit(1)
+        ).scalar()
+        volunteer_id = db.session.execute(
+            select(Application.user_id).group_by(Application.user_id)
+            .order_by(func.count().desc()).limit(1)
+        ).scalar()
+        org = db.session.get(User, org_id)
+        volunteer = db.session.get(User, volunteer_id)
+
+        # A fresh volunteer that can apply to any open opportunity
+        applicant = User(name='Benchmark Applicant', email=f'applicant-{time.time_ns()}@bench.example.org',
+                         role='volunteer')
+        applicant.set_password(PASSWORD)
+        db.session.add(applicant)
+        db.session.commit()
+
+        open_ids = db.session.scalars(
+            select(Opportunity.id).where(Opportunity.status == 'open').limit(total_requests * 2)
+        ).all()
+        pending_ids = db.session.scalars(
+            select(Application.id).join(Opportunity)
+            .where(Opportunity.org_id == org_id, Application.status == 'pending')
+        ).all()
+
+        if len(open_ids) < total_requests or len(pending_ids) < total_requests:
+            sys.exit('Dataset too small for this many requests; generate more applications '
+                     'or lower --requests')
+
+        lock = threading.Lock()
+
+        def shared(values):
+            # Thread-safe iterator handing each ID out once
+            iterator = iter(values)
+
+            def take():
+                with lock:
+                    return next(iterator)
+            return iter(take, None)
+
+        return {
+            'org_id': org_id,
+            'emails': {'volunteer': volunteer.email, 'organization': org.email, 'applicant': applicant.email},
+            'volunteer_email': volunteer.email,
+            'detail_ids': itertools.cycle(open_ids),
+            'apply_ids': shared(open_ids),
+            'pending_ids': shared(pending_ids),
+        }
+
+
+def make_client(ctx, role):
+    client = app.test_client()
+    if role != 'anonymous':
+        response = client.post('/login', data={'email': ctx['emails'][role], 'password': PASSWORD})
+        assert response.status_code == 302, f'Could not log in as {role}'
+    return client
+
+
+def run_route(route, ctx, requests, concurrency):
+    """Run a route's requests from `concurrency` threads; returns latencies and query counts"""
+    latencies = []
+    query_counts = []
+    errors = []
+    per_thread = [requests // concurrency + (1 if i < requests % concurrency else 0) for i in range(concurrency)]
+
+    def worker(count):
+        client = make_client(ctx, route.client)
+        for _ in range(count):
+            if route.client == 'anonymous':
+                # Every anonymous request is a new visitor (and a real login)
+                client = make_client(ctx, route.client)
+            method, url, data = route.request(ctx)
+            _queries.count = 0
+            start = time.perf_counter()
+            response = client.open(url, method=method, data=data)
+            latencies.append(time.perf_counter() - start)
+            query_counts.append(_queries.count)
+            if response.status_code >= 400:
+                errors.append(f'{method} {url} -> {response.status_code}')
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(worker, per_thread))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return latencies, query_counts, errors, requests / elapsed
+
+
+def main():
+    phases = [1] + ([args.concurrency] if args.concurrency > 1 else [])
+    # Routes that consume IDs run once per phase, plus the warm-up request
+    ctx = prepare(args.requests * len(phases) + 1)
+
+    with app.app_context():
+        for engine in db.engines.values():
+            event.listen(engine, 'before_cursor_execute', count_query)
+
+    failures = []
+    header = f'{"route":<32}{"threads":>8}{"req/s":>9}{"p50 ms":>9}{"p95 ms":>9}{"p99 ms":>9}{"queries":>9}{"budget":>8}'
+    print(header)
+    print('-' * len(header))
+
+    for route in ROUTES:
+        run_route(route, ctx, 1, 1)  # Warm up
+        for threads in phases:
+            latencies, query_counts, errors, throughput = run_route(route, ctx, args.requests, threads)
+            p50, p95, p99 = (percentile(latencies, pct) * 1000 for pct in (50, 95, 99))
+            max_queries = max(query_counts)
+            print(f'{route.name:<32}{threads:>8}{throughput:>9.1f}{p50:>9.1f}{p95:>9.1f}{p99:>9.1f}'
+                  f'{max_queries:>9}{route.max_queries:>8}')
+
+            if errors:
+                failures.append(f'{route.name}: {len(errors)} failed requests, e.g. {errors[0]}')
+            if max_queries > route.max_queries:
+                failures.append(f'{route.name}: {max_queries} queries (budget {route.max_queries})')
+            # Latency budgets apply to requests served one at a time
+            if threads == 1 and p95 > route.p95_ms:
+                failures.append(f'{route.name}: p95 {p95:.1f} ms (budget {route.p95_ms} ms)')
+
+    if failures:
+        print('\nBudget failures:')
+        for failure in failures:
+            print(f'  {failure}')
+        sys.exit(1)
+    print('\nAll routes within budget.')
+
+
+if __name__ == '__main__':
+    main()
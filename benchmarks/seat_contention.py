@@ -0,0 +1,149 @@
+"""
+Contention test for seat reservation on a single popular opportunity
+
+Many volunteers apply to the same opportunity at once from concurrent
+threads, then the organization rejects the seat holders concurrently so
+waitlisted volunteers get promoted. Exits non-zero if any request fails
+with a server error, more applications hold a spot than the opportunity
+had, or the spot count and applications disagree.
+
+Usage: python benchmarks/seat_contention.py [--volunteers 300] [--spots 25]
+           [--threads 32] [--no-waitlist] [--database sqlite:////path/to.db]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+# Parse options and pick the database before the app reads its config
+parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+parser.add_argument('--volunteers', type=int, default=300)
+parser.add_argument('--spots', type=int, default=25)
+parser.add_argument('--threads', type=int, default=32)
+parser.add_argument('--no-waitlist', action='store_true', help='Turn applicants away once spots run out')
+parser.add_argument('--database', help='Database URL (defaults to a new SQLite file)')
+args = parser.parse_args()
+
+os.environ['DATABASE_URL'] = args.database or 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+os.environ['CACHE_TYPE'] = 'null'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from datetime import date, timedelta  # noqa: E402
+from sqlalchemy import func, insert, select  # noqa: E402
+from app import app, db  # noqa: E402
+from models import User, Opportunity, Application  # noqa: E402
+from seats import SEAT_HOLDING  # noqa: E402
+
+
+def setup():
+    """One organization, one opportunity and the volunteers hammering it"""
+    app.config.update(WTF_CSRF_ENABLED=False, TESTING=True, APPLICATION_WAITLIST=not args.no_waitlist)
+    with app.app_context():
+        db.create_all()
+        stamp = time.time_ns()
+        org = User(name='Contention Org', email=f'org-{stamp}@bench.example.org', role='organization',
+                   password_hash='unused')
+        db.session.add(org)
+        db.session.flush()
+        opportunity = Opportunity(title='Very Popular Opportunity', description='Everyone wants to do this one.',
+                                  location='Austin, TX', date=date.today() + timedelta(days=7),
+                                  spots_available=args.spots, status='open', org_id=org.id)
+        db.session.add(opportunity)
+        db.session.execute(insert(User), [
+            {'name': f'Volunteer {n}', 'email': f'volunteer{n}-{stamp}@bench.example.org',
+             'password_hash': 'unused', 'role': 'volunteer'}
+            for n in range(args.volunteers)
+        ])
+        db.session.commit()
+        volunteer_ids = db.session.scalars(
+            select(User.id).where(User.email.like(f'%-{stamp}@bench.example.org'), User.role == 'volunteer')
+        ).all()
+        return org.id, opportunity.id, volunteer_ids
+
+
+def client_for(user_id):
+    """Test client logged in as the user, without hashing a password"""
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user_id)
+        session['_fresh'] = True
+    return client
+
+
+def hammer(label, requests):
+    """Send (user_id, url, form data) requests from the thread pool; returns server errors"""
+    def send(request):
+        user_id, url, data = request
+        return url, client_for(user_id).post(url, data=data).status_code
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as executor:
+        results = list(executor.map(send, requests))
+    elapsed = time.perf_counter() - start
+    errors = [f'{url} -> {status}' for url, status in results if status >= 500]
+    print(f'{label}: {len(requests)} requests from {args.threads} threads in {elapsed:.2f}s '
+          f'({len(requests) / elapsed:.0f} req/s), {len(errors)} server errors')
+    return errors
+
+
+def check(opp_id, expected_holding):
+    """Spot accounting invariants; returns a list of failures"""
+    with app.app_context():
+        spots_left = db.session.get(Opportunity, opp_id).spots_available
+        statuses = Counter(dict(db.session.execute(
+            select(Application.status, func.count())
+            .where(Application.opportunity_id == opp_id)
+            .group_by(Application.status)
+        ).all()))
+    holding = sum(statuses[status] for status in SEAT_HOLDING)
+    print(f'  spots left: {spots_left}, applications: {dict(statuses)}')
+
+    failures = []
+    if holding > args.spots:
+        failures.append(f'oversold: {holding} applications hold one of {args.spots} spots')
+    if spots_left < 0 or holding + spots_left != args.spots:
+        failures.append(f'{holding} seat holders + {spots_left} spots left != {args.spots} spots')
+    if holding != expected_holding:
+        failures.append(f'expected {expected_holding} seat holders, found {holding}')
+    if args.no_waitlist and statuses['waitlisted']:
+        failures.append(f'{statuses["waitlisted"]} applications waitlisted with the waitlist off')
+    return failures
+
+
+def main():
+    org_id, opp_id, volunteer_ids = setup()
+    message = {'message': 'I would love to help out and have relevant experience.'}
+
+    # Everyone applies at once (twice, to exercise the duplicate path)
+    applies = [(user_id, f'/apply/{opp_id}', message) for user_id in volunteer_ids]
+    failures = hammer('apply', applies + applies[:args.threads])
+    failures += check(opp_id, min(args.spots, len(volunteer_ids)))
+
+    # Rejecting the seat holders concurrently promotes the waitlist in order
+    with app.app_context():
+        holder_ids = db.session.scalars(
+            select(Application.id).where(Application.opportunity_id == opp_id,
+                                         Application.status.in_(SEAT_HOLDING))
+        ).all()
+        waitlisted = db.session.scalar(
+            select(func.count()).where(Application.opportunity_id == opp_id,
+                                       Application.status == 'waitlisted')
+        )
+    rejects = [(org_id, f'/application/{app_id}/update', {'action': 'reject'}) for app_id in holder_ids]
+    failures += hammer('reject', rejects)
+    failures += check(opp_id, min(len(holder_ids), waitlisted))
+
+    if failures:
+        print('\nFailures:')
+        for failure in failures:
+            print(f'  {failure}')
+        sys.exit(1)
+    print('\nNo oversold spots and no server errors.')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""
+Cold start benchmark: how long a fresh process takes to serve its first page
+
+Each run starts a new Python interpreter (as a free-tier dyno does after
+sleeping) against an existing database and times importing the app, the
+boot-time schema check, and the first request. The create_all() column
+shows what the schema step cost before it was skipped for a current
+schema. Exits non-zero if the median time to the first response is over
+budget or a heavy module is imported before it is needed.
+
+Usage: python benchmarks/startup.py [--runs 10] [--budget-ms 1000]
+           [--database sqlite:////path/to.db]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Modules that should only load when a request or command needs them
+DEFERRED_MODULES = ('numpy', 'views', 'email_validator')
+
+parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+parser.add_argument('--runs', type=int, default=10)
+parser.add_argument('--budget-ms', type=float, default=1000, help='Median time to the first response')
+parser.add_argument('--database', help='Database URL (defaults to a new SQLite file)')
+parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+args = parser.parse_args()
+
+
+def child():
+    """One cold start; prints its timings as JSON"""
+    start = time.perf_counter()
+    sys.path.insert(0, ROOT)
+    from app import app, db
+    from models import SchemaVersion
+    imported = time.perf_counter()
+    with app.app_context():
+        SchemaVersion.ensure()
+    checked = time.perf_counter()
+    loaded_at_boot = [name for name in DEFERRED_MODULES if name in sys.modules]
+    response = app.test_client().get('/')
+    served = time.perf_counter()
+    with app.app_context():
+        db.create_all()
+    created = time.perf_counter()
+    print(json.dumps({
+        'import': imported - start,
+        'schema': checked - imported,
+        'first_request': served - checked,
+        'total': served - start,
+        'create_all': created - served,
+        'status': response.status_code,
+        'loaded_at_boot': loaded_at_boot,
+    }))
+
+
+def run_child(env):
+    output = subprocess.run([sys.executable, os.path.abspath(__file__), '--child'], env=env,
+                            check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    env = dict(os.environ, CACHE_TYPE='null',
+               DATABASE_URL=args.database or 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db'))
+    first = run_child(env)  # Creates the tables (and OS file caches warm up)
+    print(f'First boot (creates the schema): {first["total"] * 1000:.0f} ms')
+
+    runs = [run_child(env) for _ in range(args.runs)]
+    phases = ('import', 'schema', 'first_request', 'total', 'create_all')
+    header = f'{"phase":<16}{"median ms":>11}{"max ms":>9}'
+    print(header)
+    print('-' * len(header))
+    for phase in phases:
+        values = [run[phase] * 1000 for run in runs]
+        print(f'{phase:<16}{statistics.median(values):>11.1f}{max(values):>9.1f}')
+
+    failures = []
+    median_total = statistics.median(run['total'] * 1000 for run in runs)
+    if median_total > args.budget_ms:
+        failures.append(f'median time to first response {median_total:.0f} ms (budget {args.budget_ms:.0f} ms)')
+    if any(run['status'] != 200 for run in runs):
+        failures.append('the first request failed')
+    loaded = sorted({name for run in runs for name in run['loaded_at_boot']})
+    if loaded:
+        failures.append(f'imported at boot: {", ".join(loaded)}')
+
+    if failures:
+        print('\nBudget failures:')
+        for failure in failures:
+            print(f'  {failure}')
+        sys.exit(1)
+    print('\nCold start within budget.')
+
+
+if __name__ == '__main__':
+    if args.child:
+        child()
+    else:
+        main()
@@ -0,0 +1,309 @@
+"""
+Bulk data tools: synthetic dataset generation and opportunity import
+
+Both insert rows in batches with a single executemany per batch instead of
+one ORM add + commit per row, so millions of rows load in minutes.
+"""
+
+import csv
+import io
+import json
+import random
+from datetime import date, datetime, timedelta
+from sqlalchemy import bindparam, func, insert, select, update
+from models import db, User, Opportunity, Application, SiteStats, user_skills
+import search
+import geo
+import skills
+import seats
+
+FIRST_NAMES = ['Alex', 'Sam', 'Jordan', 'Taylor', 'Morgan', 'Casey', 'Riley', 'Jamie', 'Avery', 'Quinn',
+               'Priya', 'Wei', 'Fatima', 'Diego', 'Amara', 'Kenji', 'Olga', 'Mateo', 'Aisha', 'Noah']
+LAST_NAMES = ['Smith', 'Garcia', 'Chen', 'Patel', 'Okafor', 'Kim', 'Novak', 'Silva', 'Haddad', 'Jones',
+              'Nguyen', 'Rossi', 'Müller', 'Cohen', 'Sato', 'Ivanova', 'Brown', 'Lopez', 'Singh', 'Ali']
+ORG_KINDS = ['Food Bank', 'Animal Shelter', 'Literacy Project', 'Community Garden', 'Youth Club',
+             'Senior Center', 'Clean Rivers Trust', 'Housing Alliance', 'Health Clinic', 'Arts Collective']
+CITIES = ['New York, NY', 'Los Angeles, CA', 'Chicago, IL', 'Houston, TX', 'Phoenix, AZ',
+          'Philadelphia, PA', 'San Antonio, TX', 'San Diego, CA', 'Dallas, TX', 'Austin, TX',
+          'Seattle, WA', 'Denver, CO', 'Boston, MA', 'Atlanta, GA', 'Miami, FL']
+ACTIVITIES = ['Food Distribution', 'Tutoring', 'Park Cleanup', 'Dog Walking', 'Meal Delivery',
+              'Event Setup', 'Tree Planting', 'Reading Buddy', 'Clinic Reception', 'Mural Painting',
+              'Warehouse Sorting', 'Coding Mentor', 'Beach Cleanup', 'Blood Drive Helper', 'Shelter Cooking']
+SKILLS = ['Communication', 'Teamwork', 'Teaching', 'Cooking', 'Driving', 'First Aid', 'Physical fitness',
+          'Programming', 'Spanish', 'Gardening', 'Photography', 'Event planning', 'Customer service']
+DURATIONS = ['2 hours', '3 hours', '4 hours', 'Half day', 'Full day', 'Weekend']
+
+# IDs per search index sync statement (stays under SQLite's bound parameter limit)
+SEARCH_SYNC_BATCH = 500
+
+# Columns accepted by the opportunity import, and which must be present
+IMPORT_FIELDS = ('title', 'description', 'location', 'date', 'duration', 'skills_required', 'spots_available')
+IMPORT_REQUIRED = ('title', 'description', 'location', 'date')
+
+
+def _insert_batches(table, rows, batch_size, progress=None, before_commit=None):
+    """
+    Insert an iterable of row dicts with one executemany per batch, calling
+    before_commit(batch) in each batch's transaction
+    """
+    batch = []
+    total = 0
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            total += _insert_batch(table, batch, before_commit)
+            batch = []
+            if progress:
+                progress(total)
+    if batch:
+        total += _insert_batch(table, batch, before_commit)
+        if progress:
+            progress(total)
+    return total
+
+
+def _insert_batch(table, batch, before_commit):
+    db.session.execute(insert(table), batch)
+    if before_commit:
+        before_commit(batch)
+    db.session.commit()
+    return len(batch)
+
+
+def generate(users, opportunities, applications, org_ratio=0.05, batch_size=5000, seed=None, progress=print):
+    """
+    Generate a realistic synthetic dataset on top of whatever is in the
+    database. Every generated account's password is 'password123'.
+    """
+    rng = random.Random(seed)
+    today = date.today()
+    now = datetime.utcnow()
+
+    # Hash once: every generated user shares the same password
+    user = User()
+    user.set_password('password123')
+    password_hash = user.password_hash
+
+    # Continue numbering after existing users so emails stay unique
+    first_id = (db.session.scalar(select(func.max(User.id))) or 0) + 1
+    org_count = max(1, int(users * org_ratio))
+    # Known cities get coordinates for radius search
+    geocoder = geo.Geocoder()
+
+    def user_rows():
+        for n in range(first_id, first_id + users):
+            is_org = n - first_id < org_count
+            city = rng.choice(CITIES)
+            if is_org:
+                name = f'{city.split(",")[0]} {rng.choice(ORG_KINDS)} #{n}'
+            else:
+                name = f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}'
+            yield {
+                'name': name,
+                'email': f'user{n}@{"org" if is_org else "volunteer"}.example.org',
+                'password_hash': password_hash,
+                'role': 'organization' if is_org else 'volunteer',
+                'phone': f'555-{rng.randint(0, 9999):04d}',
+                'location': city,
+                'bio': f'We run {name} and welcome new volunteers.' if is_org else None,
+                'created_at': now - timedelta(days=rng.randint(0, 730)),
+                **geocoder.columns(city, geohash=False),
+            }
+
+    progress(f'Generating {users} users ({org_count} organizations)...')
+    _insert_batches(User.__table__, user_rows(), batch_size,
+                    lambda done: progress(f'  users: {done}/{users}'))
+
+    # Give the new volunteers a few skills each for recommendations
+    skill_ids = list(skills.skill_ids(skills.parse_skills(', '.join(SKILLS))).values())
+    new_volunteer_ids = db.session.scalars(select(User.id).where(
+        User.id >= first_id, User.role == 'volunteer')).all()
+
+    def user_skill_rows():
+        for user_id in new_volunteer_ids:
+            for skill_id in rng.sample(skill_ids, rng.randint(1, 4)):
+                yield {'user_id': user_id, 'skill_id': skill_id}
+
+    _insert_batches(user_skills, user_skill_rows(), batch_size)
+
+    # New listings and applications may also use accounts that already existed
+    org_ids = db.session.scalars(select(User.id).where(User.role == 'organization')).all()
+    volunteer_ids = db.session.scalars(select(User.id).where(User.role == 'volunteer')).all()
+    if opportunities and not org_ids:
+        raise ValueError('Generating opportunities needs at least one organization')
+    first_opp_id = (db.session.scalar(select(func.max(Opportunity.id))) or 0) + 1
+
+    def opportunity_rows():
+        for _ in range(opportunities):
+            status = rng.choices(['open', 'closed', 'completed'], weights=[80, 10, 10])[0]
+            days = rng.randint(1, 180) if status == 'open' else -rng.randint(1, 365)
+            activity = rng.choice(ACTIVITIES)
+            city = rng.choice(CITIES)
+            required = rng.sample(SKILLS, rng.randint(1, 3))
+            location = f'{rng.randint(1, 9999)} Main St, {city}'
+            yield {
+                'title': f'{activity} Volunteer',
+                'description': (f'Join us for {activity.lower()} in {city}. '
+                                f'Ideal for people with {", ".join(required).lower()} skills. '
+                                'No experience required, training is provided on the day.'),
+                'location': location,
+                'date': today + timedelta(days=days),
+                'duration': rng.choice(DURATIONS),
+                'skills_required': ', '.join(required),
+                'spots_available': rng.randint(1, 50),
+                'status': status,
+                'created_at': now - timedelta(days=rng.randint(0, 365), seconds=rng.randint(0, 86399)),
+                'org_id': rng.choice(org_ids),
+                **geocoder.columns(location),
+            }
+
+    progress(f'Generating {opportunities} opportunities...')
+    _insert_batches(Opportunity.__table__, opportunity_rows(), batch_size,
+                    lambda done: progress(f'  opportunities: {done}/{opportunities}'))
+
+    capacities = dict(db.session.execute(select(Opportunity.id, Opportunity.spots_available)
+                                         .where(Opportunity.id >= first_opp_id).order_by(Opportunity.id)).all())
+    opp_ids = list(capacities)
+    held_counts = {}
+
+    def application_rows():
+        # Spread applications over opportunities; sampling volunteers without
+        # replacement per opportunity keeps (user_id, opportunity_id) unique
+        remaining = applications
+        per_opp = applications / max(len(opp_ids), 1)
+        for index, opp_id in enumerate(opp_ids):
+            if remaining <= 0 or not volunteer_ids:
+                return
+            slots_left = len(opp_ids) - index
+            count = remaining if slots_left == 1 else int(rng.uniform(0, 2 * per_opp) + 0.5)
+            count = min(count, remaining, len(volunteer_ids))
+            applied = sorted((now - timedelta(days=rng.randint(0, 180), seconds=rng.randint(0, 86399)), user_id)
+                             for user_id in rng.sample(volunteer_ids, count))
+            # Like seats.submit_application: in order of applying, later
+            # applicants are waitlisted once the spots are taken
+            held = 0
+            for applied_at, user_id in applied:
+                status = rng.choices(['pending', 'accepted', 'rejected'], weights=[50, 35, 15])[0]
+                if status in seats.SEAT_HOLDING:
+                    if held < capacities[opp_id]:
+                        held += 1
+                    else:
+                        status = 'waitlisted'
+                # Decided within a week, but not in the future
+                decided_at = min(applied_at + timedelta(seconds=rng.randint(600, 7 * 86400)), now)
+                yield {
+                    'message': 'I would love to help out and have some relevant experience.',
+                    'status': status,
+                    'applied_at': applied_at,
+                    'decided_at': decided_at if status in ('accepted', 'rejected') else None,
+                    'user_id': user_id,
+                    'opportunity_id': opp_id,
+                }
+            held_counts[opp_id] = held
+            remaining -= count
+
+    progress(f'Generating {applications} applications...')
+    created = _insert_batches(Application.__table__, application_rows(), batch_size,
+                              lambda done: progress(f'  applications: {done}/{applications}'))
+    # spots_available was generated as the capacity; leave the spots left
+    table = Opportunity.__table__
+    spots_left = [{'row_id': opp_id, 'spots_available': capacities[opp_id] - held}
+                  for opp_id, held in held_counts.items() if held]
+    for start in range(0, len(spots_left), batch_size):
+        db.session.execute(update(table).where(table.c.id == bindparam('row_id')),
+                           spots_left[start:start + batch_size])
+        db.session.commit()
+    return {'users': users, 'opportunities': len(opp_ids), 'applications': created}
+
+
+def _read_rows(stream, fmt):
+    """Yield (line number, row dict) from a CSV or JSONL text stream"""
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+    elif fmt == 'jsonl':
+        for line_num, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                yield line_num, None
+                continue
+            yield line_num, row if isinstance(row, dict) else None
+    else:
+        raise ValueError(f'Unsupported import format {fmt!r}')
+
+
+def _clean_row(row, org_id):
+    """Validate one imported row like OpportunityForm does; returns (values, error)"""
+    if row is None:
+        return None, 'not a valid record'
+    values = {field: str(row.get(field) or '').strip() for field in IMPORT_FIELDS}
+    missing = [field for field in IMPORT_REQUIRED if not values[field]]
+    if missing:
+        return None, f'missing {", ".join(missing)}'
+    if not 5 <= len(values['title']) <= 200:
+        return None, 'title must be 5-200 characters'
+    if len(values['description']) < 20:
+        return None, 'description must be at least 20 characters'
+    if len(values['location']) > 100 or len(values['duration']) > 50 or len(values['skills_required']) > 200:
+        return None, 'location, duration or skills_required is too long'
+    try:
+        values['date'] = date.fromisoformat(values['date'])
+    except ValueError:
+        return None, 'date must be YYYY-MM-DD'
+    try:
+        values['spots_available'] = int(values['spots_available'] or 1)
+    except ValueError:
+        return None, 'spots_available must be a number'
+    if values['spots_available'] < 1:
+        return None, 'spots_available must be at least 1'
+    values.update(duration=values['duration'] or None, skills_required=values['skills_required'] or None,
+                  org_id=org_id, status='open', created_at=datetime.utcnow())
+    return values, None
+
+
+def import_opportunities(stream, fmt, org_id, batch_size=1000, max_errors=50):
+    """
+    Stream opportunities for an organization from a CSV or JSONL text stream.
+    Invalid rows are skipped and reported as (line number, reason).
+    """
+    errors = []
+    geocoder = geo.Geocoder()
+
+    def valid_rows():
+        for line_num, row in _read_rows(stream, fmt):
+            values, error = _clean_row(row, org_id)
+            if error:
+                if len(errors) < max_errors:
+                    errors.append((line_num, error))
+                continue
+            values.update(geocoder.columns(values['location']))
+            yield values
+
+    last_id = db.session.scalar(select(func.max(Opportunity.id))) or 0
+
+    def index_batch(batch):
+        # Index the batch for search and recommendations and count it on the
+        # homepage in the transaction that inserts it, so no committed
+        # listing is ever missing from them
+        nonlocal last_id
+        new_ids = db.session.scalars(select(Opportunity.id).where(
+            Opportunity.id > last_id, Opportunity.org_id == org_id).order_by(Opportunity.id)).all()
+        for start in range(0, len(new_ids), SEARCH_SYNC_BATCH):
+            search.sync_opportunities(new_ids[start:start + SEARCH_SYNC_BATCH])
+        skills.link_opportunities(new_ids)
+        SiteStats.adjust(open_opportunities=len(batch))
+        if new_ids:
+            last_id = new_ids[-1]
+
+    imported = _insert_batches(Opportunity.__table__, valid_rows(), batch_size, before_commit=index_batch)
+    skills.recommender.opportunities_created()
+    return imported, errors
+
+
+def text_stream(binary_stream):
+    """Wrap an uploaded file for streaming text reads"""
+    return io.TextIOWrapper(binary_stream, encoding='utf-8-sig', newline='')
@@ -0,0 +1,295 @@
+"""
+Caches for public pages and for the logged-in user's identity
+
+Cached pages are keyed by a content version, so invalidating every page is a
+single version bump. The in-process LRU backend is per worker; the filesystem
+backend shares pages and the version between gunicorn workers on one host.
+"""
+
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from functools import wraps
+from flask import current_app, request, session, make_response
+from flask_login import current_user
+from database import use_primary
+
+
+class MemoryBackend:
+    """Thread-safe in-process LRU cache with a TTL and a size bound"""
+
+    shared = False  # Other processes never see its entries or version
+
+    def __init__(self, max_entries, default_ttl):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._version = uuid.uuid4().hex
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + (ttl or self.default_ttl)
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get_version(self):
+        return self._version
+
+    def bump_version(self):
+        self._version = uuid.uuid4().hex
+
+
+class FileSystemBackend:
+    """
+    Cache stored as one file per entry in a local directory, so every worker
+    process on the host shares the entries and the content version
+    """
+
+    VERSION_FILE = 'version'
+    shared = True
+
+    def __init__(self, cache_dir, max_entries, default_ttl):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, hashlib.sha1(str(key).encode()).hexdigest() + '.cache')
+
+    def _write(self, path, data):
+        # Write to a temp file and rename so readers never see partial files
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def get(self, key):
+        try:
+            with open(self._path(key), 'rb') as f:
+                expires_at, value = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        if expires_at < time.time():
+            return None
+        return value
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.time() + (ttl or self.default_ttl)
+        self._write(self._path(key), pickle.dumps((expires_at, value), pickle.HIGHEST_PROTOCOL))
+        self._prune()
+
+    def _prune(self):
+        """Drop the least recently written entries beyond the size bound"""
+        entries = [entry for entry in os.scandir(self.cache_dir) if entry.name.endswith('.cache')]
+        if len(entries) <= self.max_entries:
+            return
+        entries.sort(key=lambda entry: entry.stat().st_mtime)
+        for entry in entries[:len(entries) - self.max_entries]:
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def clear(self):
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith('.cache'):
+                os.remove(entry.path)
+
+    def __len__(self):
+        return sum(1 for entry in os.scandir(self.cache_dir) if entry.name.endswith('.cache'))
+
+    def get_version(self):
+        try:
+            with open(os.path.join(self.cache_dir, self.VERSION_FILE)) as f:
+                return f.read()
+        except OSError:
+            return ''
+
+    def bump_version(self):
+        self._write(os.path.join(self.cache_dir, self.VERSION_FILE), uuid.uuid4().hex.encode())
+
+
+class NullBackend:
+    """Backend that never caches anything"""
+
+    shared = False
+
+    def get(self, key):
+        return None
+
+    def set(self, key, value, ttl=None):
+        pass
+
+    def delete(self, key):
+        pass
+
+    def clear(self):
+        pass
+
+    def __len__(self):
+        return 0
+
+    def get_version(self):
+        return ''
+
+    def bump_version(self):
+        pass
+
+
+class PageCache:
+    """
+    Caches the rendered pages of public views for anonymous visitors and
+    answers conditional GETs with 304 using strong ETags
+    """
+
+    def __init__(self, app=None):
+        self.backend = NullBackend()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        cache_type = app.config.get('CACHE_TYPE', 'memory')
+        max_entries = app.config.get('CACHE_THRESHOLD', 500)
+        default_ttl = app.config.get('CACHE_DEFAULT_TIMEOUT', 300)
+
+        if cache_type == 'memory':
+            self.backend = MemoryBackend(max_entries, default_ttl)
+        elif cache_type == 'filesystem':
+            cache_dir = app.config.get('CACHE_DIR') or os.path.join(app.instance_path, 'page_cache')
+            self.backend = FileSystemBackend(cache_dir, max_entries, default_ttl)
+        elif cache_type == 'null':
+            self.backend = NullBackend()
+        else:
+            raise ValueError(f'Unknown CACHE_TYPE {cache_type!r}')
+
+        app.extensions['page_cache'] = self
+
+    def invalidate(self):
+        """Invalidate every cached page (call after committing a change)"""
+        self.backend.bump_version()
+
+    def cached(self, view):
+        """Decorator caching a view's page for anonymous GET requests"""
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            # Logged-in users and pending flash messages get a personalised page
+            if (request.method != 'GET' or current_user.is_authenticated
+                    or session.get('_flashes')):
+                return view(*args, **kwargs)
+
+            key = f'page:{self.backend.get_version()}:{request.full_path}'
+            entry = self.backend.get(key)
+            if entry is None:
+                # The page is stored under the current version, so it must not
+                # be rendered from a replica that hasn't seen the latest write
+                use_primary()
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200 or response.direct_passthrough:
+                    return response
+                body = response.get_data()
+                entry = (body, response.content_type, hashlib.sha1(body).hexdigest())
+                self.backend.set(key, entry)
+
+            body, content_type, etag = entry
+            response = current_app.response_class(body, content_type=content_type)
+            response.set_etag(etag)
+            # Always revalidate, and never share the anonymous page with logged-in users
+            response.headers['Cache-Control'] = 'no-cache'
+            response.vary.add('Cookie')
+            return response.make_conditional(request)
+        return wrapper
+
+
+class IdentityCache:
+    """
+    Bounded, TTL-evicting cache of user rows for the Flask-Login user loader,
+    with hit/miss counters (per process). Entries are plain column values, so
+    callers rebuild a session-bound object from them. With
+    CACHE_TYPE='filesystem' the entries are shared by every worker, so
+    invalidating a user reaches all of them.
+    """
+
+    def __init__(self, app=None):
+        self.backend = NullBackend()
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.invalidations = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        ttl = app.config.get('IDENTITY_CACHE_TTL', 60)
+        max_entries = app.config.get('IDENTITY_CACHE_SIZE', 10000)
+        if ttl <= 0:
+            self.backend = NullBackend()
+        elif app.config.get('CACHE_TYPE') == 'filesystem':
+            cache_dir = app.config.get('CACHE_DIR') or os.path.join(app.instance_path, 'page_cache')
+            self.backend = FileSystemBackend(os.path.join(cache_dir, 'identity'), max_entries, ttl)
+        else:
+            self.backend = MemoryBackend(max_entries, ttl)
+        app.extensions['identity_cache'] = self
+
+    def get(self, user_id):
+        values = self.backend.get(user_id)
+        with self._lock:
+            if values is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return values
+
+    def set(self, user_id, values):
+        self.backend.set(user_id, values)
+
+    def invalidate(self, user_id):
+        """Forget a user, e.g. after their row was updated or deleted"""
+        self.backend.delete(user_id)
+        with self._lock:
+            self.invalidations += 1
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'invalidations': self.invalidations,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'size': len(self.backend),
+        }
@@ -0,0 +1,241 @@
+"""
+Management commands (`flask --app app <command>`)
+"""
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from models import db, User, Opportunity, SchemaVersion, SiteStats
+from database import copy_primary_to_replicas
+from extensions import page_cache
+import search
+import bulkdata
+import jobs
+import notifications  # noqa: F401 (registers the notify job handler)
+import lifecycle
+import mailer
+import geo
+import skills
+import assets
+import analytics
+
+
+@click.command()
+@with_appcontext
+def initdb():
+    """Initialize the database, or bring an existing one up to date."""
+    SchemaVersion.ensure(force=True)
+    geo.ensure_places()
+    db.session.commit()
+    print('Database initialized!')
+
+
+@click.command()
+@with_appcontext
+def rebuildsearch():
+    """Rebuild the opportunity search index."""
+    search.rebuild_index()
+    print('Search index rebuilt!')
+
+
+@click.command('lifecycle')
+@with_appcontext
+def run_lifecycle():
+    """Complete past opportunities and archive old completed ones."""
+    completed, archived = lifecycle.run(current_app.config)
+    lifecycle.invalidate_pages()
+    print(f'Completed {completed} and archived {archived} opportunities!')
+
+
+@click.command()
+@with_appcontext
+def rebuildskills():
+    """Relink every opportunity to the skills in its skills_required."""
+    count = skills.rebuild_opportunity_skills()
+    print(f'Linked skills for {count} opportunities!')
+
+
+@click.command()
+@with_appcontext
+def rebuildanalytics():
+    """Recount the daily application analytics from every application."""
+    count = analytics.rebuild()
+    db.session.commit()
+    print(f'Rebuilt {count} daily analytics rows!')
+
+
+@click.command()
+@click.option('--clean', is_flag=True, help='Delete files left from earlier builds.')
+@with_appcontext
+def buildassets(clean):
+    """Fingerprint and precompress the static files."""
+    manifest = assets.build(current_app.static_folder, clean=clean)
+    encodings = sorted({encoding for found in manifest['encodings'].values() for encoding in found})
+    print(f'Built {len(manifest["files"])} assets ({", ".join(encodings) or "uncompressed"})!')
+
+
+@click.command()
+@with_appcontext
+def rebuildstats():
+    """Recount the homepage statistics."""
+    SiteStats.rebuild()
+    db.session.commit()
+    print('Homepage statistics rebuilt!')
+
+
+@click.command()
+@with_appcontext
+@click.option('--users', default=1000, show_default=True, help='Users to create.')
+@click.option('--opportunities', default=5000, show_default=True, help='Opportunities to create.')
+@click.option('--applications', default=20000, show_default=True, help='Applications to create.')
+@click.option('--org-ratio', default=0.05, show_default=True, help='Share of users that are organizations.')
+@click.option('--batch-size', default=5000, show_default=True, help='Rows per INSERT batch.')
+@click.option('--seed', type=int, help='Random seed for a reproducible dataset.')
+def gendata(users, opportunities, applications, org_ratio, batch_size, seed):
+    """Generate a large synthetic dataset."""
+    geo.ensure_places()
+    db.session.commit()
+    counts = bulkdata.generate(users, opportunities, applications, org_ratio, batch_size, seed)
+    
+    # Derived data is cheaper to rebuild once than to maintain per row
+    search.rebuild_index()
+    skills.rebuild_opportunity_skills()
+    analytics.rebuild()
+    SiteStats.rebuild()
+    db.session.commit()
+    page_cache.invalidate()
+    print(f"Generated {counts['users']} users, {counts['opportunities']} opportunities "
+          f"and {counts['applications']} applications (password: password123)")
+
+
+@click.command()
+@with_appcontext
+@click.argument('org_email')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl']), help='Defaults to the file extension.')
+def importopps(org_email, path, fmt):
+    """Import opportunities for an organization from a CSV or JSONL file."""
+    org = User.query.filter_by(email=org_email, role='organization').first()
+    if org is None:
+        raise click.ClickException(f'No organization with email {org_email}')
+    
+    fmt = fmt or path.rsplit('.', 1)[-1].lower()
+    with open(path, encoding='utf-8-sig', newline='') as f:
+        imported, errors = bulkdata.import_opportunities(f, fmt, org.id)
+    page_cache.invalidate()
+    
+    for line_num, error in errors:
+        print(f'Line {line_num} skipped: {error}')
+    print(f'Imported {imported} opportunities for {org.name}!')
+
+
+@click.command()
+@with_appcontext
+@click.argument('path', required=False, type=click.Path(exists=True, dir_okay=False))
+def loadplaces(path):
+    """Load the geocoding places table from a CSV (name,latitude,longitude)."""
+    count = geo.load_places(path or geo.PLACES_FILE)
+    db.session.commit()
+    users = geo.backfill(User, only_missing=False)
+    opportunities = geo.backfill(Opportunity, only_missing=False)
+    print(f'Loaded {count} places; {users} users and {opportunities} opportunities have coordinates!')
+
+
+@click.command()
+@with_appcontext
+def syncreplicas():
+    """Copy the SQLite primary into the SQLite replicas (local testing)."""
+    count = copy_primary_to_replicas(current_app, db)
+    print(f'Copied the primary database to {count} replica(s)!')
+
+
+@click.command()
+@with_appcontext
+@click.option('--once', is_flag=True, help='Exit when no jobs are due instead of polling.')
+def worker(once):
+    """Run background jobs such as email notifications."""
+    job_worker = jobs.Worker(current_app._get_current_object())
+    print(f'Worker {job_worker.worker_id} running jobs: {", ".join(sorted(jobs.HANDLERS))}')
+    job_worker.run(once=once)
+
+
+@click.command()
+@with_appcontext
+def mailsink():
+    """Run a local SMTP server that prints mail instead of delivering it."""
+    def show(sender, recipients, message):
+        print(f'--- From {sender} to {", ".join(recipients)}\n{message}', flush=True)
+    
+    server = mailer.SMTPSink(current_app.config['MAIL_SERVER'], current_app.config['MAIL_PORT'], on_message=show)
+    print(f'Mail sink listening on {current_app.config["MAIL_SERVER"]}:{current_app.config["MAIL_PORT"]}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+@click.command()
+@with_appcontext
+def seeddb():
+    """Seed the database with sample data."""
+    # Create sample organization
+    org = User(
+        name='Community Food Bank',
+        email='contact@foodbank.org',
+        role='organization',
+        phone='555-0100',
+        location='New York, NY',
+        bio='Dedicated to fighting hunger in our community.'
+    )
+    org.set_password('password123')
+    db.session.add(org)
+    db.session.commit()
+    
+    # Create sample volunteer
+    volunteer = User(
+        name='John Doe',
+        email='john@example.com',
+        role='volunteer',
+        phone='555-0200',
+        location='New York, NY'
+    )
+    volunteer.set_password('password123')
+    db.session.add(volunteer)
+    db.session.flush()
+    skills.set_user_skills(volunteer.id, 'Communication, Cooking, Physical fitness')
+    db.session.commit()
+    
+    # Create sample opportunity
+    from datetime import date, timedelta
+    opportunity = Opportunity(
+        title='Food Distribution Volunteer',
+        description='Help us distribute food to families in need. We need energetic volunteers to help pack and distribute food boxes.',
+        location='123 Main St, New York, NY',
+        date=date.today() + timedelta(days=7),
+        duration='4 hours',
+        skills_required='Physical fitness, Communication',
+        spots_available=10,
+        org_id=org.id,
+        status='open'
+    )
+    db.session.add(opportunity)
+    db.session.flush()
+    search.sync_opportunities([opportunity.id])
+    skills.link_opportunities([opportunity.id])
+    SiteStats.rebuild()
+    db.session.commit()
+    page_cache.invalidate()
+    
+    print('Database seeded with sample data!')
+    print('Organization: contact@foodbank.org / password123')
+    print('Volunteer: john@example.com / password123')
+
+
+COMMANDS = (initdb, rebuildsearch, run_lifecycle, rebuildskills, rebuildanalytics, buildassets, rebuildstats,
+            gendata, importopps, loadplaces, syncreplicas, worker, mailsink, seeddb)
+
+
+def init_app(app):
+    """Add the management commands to the app's CLI"""
+    for command in COMMANDS:
+        app.cli.add_command(command)
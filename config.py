@@ -4,6 +4,32 @@ from dotenv import load_dotenv
 # Load environment variables from .env file
 load_dotenv()
 
+
+def env_flag(name, default):
+    """Read a true/false environment variable"""
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.lower() in ('1', 'true', 'yes', 'on')
+
+
+def engine_options(database_uri):
+    """
+    SQLAlchemy engine options for the configured database. Server databases
+    get a tunable connection pool that pings and recycles connections, so
+    MySQL's idle timeout never hands out a dead connection.
+    """
+    if database_uri.startswith('sqlite'):
+        return {}
+    return {
+        'pool_size': int(os.environ.get('DB_POOL_SIZE') or 10),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW') or 20),
+        'pool_timeout': int(os.environ.get('DB_POOL_TIMEOUT') or 30),  # Seconds to wait for a connection
+        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE') or 280),  # Seconds, below MySQL's idle timeout
+        'pool_pre_ping': env_flag('DB_POOL_PRE_PING', True),
+    }
+
+
 class Config:
     """
     Configuration settings for the Flask application
@@ -19,6 +45,134 @@ class Config:
     # Disable modification tracking (saves resources)
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     
+    # Bring the schema up to date in create_app() (one read when it already
+    # is), so `gunicorn app:app` and `flask run` never serve a database that
+    # lacks new columns or upgrades. Turn off to run `flask --app app initdb`
+    # as a release step instead.
+    SCHEMA_SYNC_ON_STARTUP = env_flag('SCHEMA_SYNC_ON_STARTUP', True)
+    
+    # Optional read replicas (comma-separated URLs). GET requests read from a
+    # replica unless the same user wrote within REPLICA_READ_AFTER_WRITE seconds.
+    DATABASE_REPLICA_URLS = [
+        url.strip() for url in (os.environ.get('DATABASE_REPLICA_URL') or '').split(',') if url.strip()
+    ]
+    SQLALCHEMY_BINDS = {f'replica{i}': url for i, url in enumerate(DATABASE_REPLICA_URLS)}
+    REPLICA_READ_AFTER_WRITE = float(os.environ.get('REPLICA_READ_AFTER_WRITE') or 5)
+    
+    # Connection pool settings (see engine_options above)
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(SQLALCHEMY_DATABASE_URI)
+    
+    # SQLite pragmas applied to every connection: WAL lets readers run while a
+    # write is in progress, and busy_timeout makes writers wait for the lock
+    SQLITE_JOURNAL_MODE = os.environ.get('SQLITE_JOURNAL_MODE') or 'WAL'
+    SQLITE_BUSY_TIMEOUT = int(os.environ.get('SQLITE_BUSY_TIMEOUT') or 5000)  # Milliseconds
+    SQLITE_SYNCHRONOUS = os.environ.get('SQLITE_SYNCHRONOUS') or 'NORMAL'  # Safe with WAL
+    SQLITE_CACHE_SIZE = int(os.environ.get('SQLITE_CACHE_SIZE') or -64000)  # Negative = KiB
+    SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE') or 268435456)  # Bytes
+    
     # WTForms CSRF settings
     WTF_CSRF_ENABLED = True
-    WTF_CSRF_TIME_LIMIT = None  # No time limit on CSRF tokens
\ No newline at end of file
+    WTF_CSRF_TIME_LIMIT = None  # No time limit on CSRF tokens
+    
+    # Number of opportunities shown per page on the browse page
+    OPPORTUNITIES_PER_PAGE = int(os.environ.get('OPPORTUNITIES_PER_PAGE') or 12)
+    
+    # Skill-based recommendations on the volunteer dashboard. Each worker
+    # keeps an index of open opportunities, adds new ones every REFRESH
+    # seconds and rebuilds it every REBUILD seconds.
+    RECOMMENDATIONS_LIMIT = int(os.environ.get('RECOMMENDATIONS_LIMIT') or 6)
+    RECOMMENDATION_REFRESH_INTERVAL = int(os.environ.get('RECOMMENDATION_REFRESH_INTERVAL') or 30)
+    RECOMMENDATION_REBUILD_INTERVAL = int(os.environ.get('RECOMMENDATION_REBUILD_INTERVAL') or 3600)
+    
+    # Opportunity lifecycle, run by the worker every LIFECYCLE_INTERVAL seconds:
+    # opportunities whose date has passed become completed, and completed ones
+    # older than ARCHIVE_AFTER_DAYS move with their applications to the archive
+    LIFECYCLE_INTERVAL = int(os.environ.get('LIFECYCLE_INTERVAL') or 3600)  # Seconds
+    LIFECYCLE_BATCH_SIZE = int(os.environ.get('LIFECYCLE_BATCH_SIZE') or 500)  # Opportunities per transaction
+    ARCHIVE_AFTER_DAYS = int(os.environ.get('ARCHIVE_AFTER_DAYS') or 90)
+    # Past (archived) opportunities and applications listed on the dashboards
+    DASHBOARD_HISTORY_LIMIT = int(os.environ.get('DASHBOARD_HISTORY_LIMIT') or 20)
+    # Organization analytics: days of daily trends, and opportunities compared
+    ANALYTICS_DAYS = int(os.environ.get('ANALYTICS_DAYS') or 30)
+    ANALYTICS_TOP_OPPORTUNITIES = int(os.environ.get('ANALYTICS_TOP_OPPORTUNITIES') or 10)
+    
+    # When an opportunity's spots run out, put new applicants on a waitlist
+    # (promoted in order as spots free up) instead of turning them away
+    APPLICATION_WAITLIST = env_flag('APPLICATION_WAITLIST', True)
+    
+    # Page cache for anonymous visitors: 'memory' (per worker), 'filesystem'
+    # (shared by all workers on the host, stored in CACHE_DIR) or 'null'.
+    # run.py uses 'filesystem' when it starts more than one worker and
+    # CACHE_TYPE isn't set, so an invalidation reaches every worker
+    CACHE_TYPE = os.environ.get('CACHE_TYPE') or 'memory'
+    CACHE_DIR = os.environ.get('CACHE_DIR')
+    CACHE_DEFAULT_TIMEOUT = int(os.environ.get('CACHE_DEFAULT_TIMEOUT') or 300)  # Seconds
+    CACHE_THRESHOLD = int(os.environ.get('CACHE_THRESHOLD') or 500)  # Max cached pages
+    
+    # Cache of logged-in users for the Flask-Login user loader, in the page
+    # cache's backend (set IDENTITY_CACHE_TTL to 0 to disable)
+    IDENTITY_CACHE_TTL = int(os.environ.get('IDENTITY_CACHE_TTL') or 60)  # Seconds
+    IDENTITY_CACHE_SIZE = int(os.environ.get('IDENTITY_CACHE_SIZE') or 10000)  # Max cached users
+    
+    # Static assets: `flask --app app buildassets` writes fingerprinted, precompressed
+    # copies to static/dist, which are cached by browsers for ASSET_MAX_AGE
+    ASSET_MAX_AGE = int(os.environ.get('ASSET_MAX_AGE') or 31536000)  # Seconds (one year)
+    # Gzip HTML and JSON responses of at least COMPRESS_MIN_SIZE bytes
+    COMPRESS_RESPONSES = env_flag('COMPRESS_RESPONSES', True)
+    COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE') or 1024)  # Bytes
+    COMPRESS_LEVEL = int(os.environ.get('COMPRESS_LEVEL') or 6)  # 1 (fastest) to 9 (smallest)
+    
+    # Password hashing (Werkzeug method string, e.g. 'scrypt:32768:8:1' or
+    # 'pbkdf2:sha256:600000'). Stored hashes made with another method or cost
+    # are upgraded on the next successful login.
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD') or 'scrypt:32768:8:1'
+    # Hashing runs in a process pool of this many workers (0 hashes in the request thread)
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS') or 2)
+    # Requests beyond this many queued hashes fail fast instead of waiting
+    PASSWORD_HASH_QUEUE_LIMIT = int(os.environ.get('PASSWORD_HASH_QUEUE_LIMIT') or 32)
+    
+    # Instrumentation: queries and requests slower than these are logged, and
+    # per-endpoint metrics are served at /metrics in the Prometheus format
+    SLOW_QUERY_THRESHOLD_MS = int(os.environ.get('SLOW_QUERY_THRESHOLD_MS') or 100)
+    SLOW_REQUEST_THRESHOLD_MS = int(os.environ.get('SLOW_REQUEST_THRESHOLD_MS') or 500)
+    METRICS_ENABLED = env_flag('METRICS_ENABLED', True)
+    
+    # Background jobs (run by `flask --app app worker`): failed jobs are
+    # retried after JOB_RETRY_BACKOFF * 2^n seconds, up to JOB_MAX_ATTEMPTS
+    JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS') or 5)
+    JOB_RETRY_BACKOFF = int(os.environ.get('JOB_RETRY_BACKOFF') or 30)  # Seconds
+    JOB_RETRY_BACKOFF_MAX = int(os.environ.get('JOB_RETRY_BACKOFF_MAX') or 3600)  # Seconds
+    JOB_LOCK_TIMEOUT = int(os.environ.get('JOB_LOCK_TIMEOUT') or 600)  # Requeue jobs running longer (seconds)
+    JOB_POLL_INTERVAL = float(os.environ.get('JOB_POLL_INTERVAL') or 1.0)  # Seconds
+    
+    # Email notifications, sent by the worker. Notifications for the same
+    # recipient within NOTIFICATION_DELAY seconds are combined into one email.
+    # The defaults match the local stand-in started by `flask --app app mailsink`.
+    NOTIFICATIONS_ENABLED = env_flag('NOTIFICATIONS_ENABLED', True)
+    NOTIFICATION_DELAY = int(os.environ.get('NOTIFICATION_DELAY', 30))  # Seconds
+    MAIL_SERVER = os.environ.get('MAIL_SERVER') or 'localhost'
+    MAIL_PORT = int(os.environ.get('MAIL_PORT') or 1025)
+    MAIL_USE_TLS = env_flag('MAIL_USE_TLS', False)
+    MAIL_USERNAME = os.environ.get('MAIL_USERNAME')
+    MAIL_PASSWORD = os.environ.get('MAIL_PASSWORD')
+    MAIL_DEFAULT_SENDER = os.environ.get('MAIL_DEFAULT_SENDER') or 'Socio+ <no-reply@socioplus.local>'
+    MAIL_TIMEOUT = int(os.environ.get('MAIL_TIMEOUT') or 10)  # Seconds
+    
+    # Production server (`python run.py`): gunicorn with preforked workers.
+    # SERVER_WORKERS and SERVER_THREADS of 0 are derived from the CPUs the
+    # process may use; 'gevent' workers need `pip install gevent`.
+    SERVER_BIND = os.environ.get('SERVER_BIND') or f"0.0.0.0:{os.environ.get('PORT') or 8000}"
+    SERVER_WORKER_CLASS = os.environ.get('SERVER_WORKER_CLASS') or 'gthread'  # 'gthread' or 'gevent'
+    SERVER_WORKERS = int(os.environ.get('SERVER_WORKERS') or 0)
+    SERVER_THREADS = int(os.environ.get('SERVER_THREADS') or 0)  # Per gthread worker
+    SERVER_WORKER_CONNECTIONS = int(os.environ.get('SERVER_WORKER_CONNECTIONS') or 1000)  # Per gevent worker
+    # Import the app once in the master so workers fork with it loaded (faster
+    # boots, shared memory); turn off to have HUP reloads pick up new code
+    SERVER_PRELOAD = env_flag('SERVER_PRELOAD', True)
+    # Recycle a worker after this many requests (plus up to JITTER, so they
+    # don't all restart together) to cap memory growth; 0 never recycles
+    SERVER_MAX_REQUESTS = int(os.environ.get('SERVER_MAX_REQUESTS') or 1000)
+    SERVER_MAX_REQUESTS_JITTER = int(os.environ.get('SERVER_MAX_REQUESTS_JITTER') or 100)
+    SERVER_TIMEOUT = int(os.environ.get('SERVER_TIMEOUT') or 30)  # Seconds before a stuck worker is killed
+    SERVER_GRACEFUL_TIMEOUT = int(os.environ.get('SERVER_GRACEFUL_TIMEOUT') or 30)  # Seconds to finish requests
+    SERVER_KEEPALIVE = int(os.environ.get('SERVER_KEEPALIVE') or 5)  # Seconds
@@ -0,0 +1,110 @@
+"""
+Database engine tuning and read-replica routing
+
+SQLite connections get WAL journaling and the pragmas from Config applied as
+soon as they are opened, so readers never block on the writer and writers
+wait for the lock instead of failing with "database is locked".
+
+When read replicas are configured, GET/HEAD requests read from one of them
+while every write, and every read by a user who wrote within the last few
+seconds, goes to the primary. So do the reads of a request that calls
+use_primary(): one rendering a page into the shared page cache (a lagging
+replica would cache the page as it was before a write for the whole TTL),
+or a GET that writes what it read.
+"""
+
+import random
+import time
+from flask import g, has_request_context, request, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+
+# Replicas are the SQLALCHEMY_BINDS entries whose keys start with this
+REPLICA_BIND_PREFIX = 'replica'
+
+
+class RoutingSession(Session):
+    """Session that sends reads in read-only requests to a replica engine"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and has_request_context():
+            is_write = self._flushing or getattr(clause, 'is_dml', False)
+            if is_write:
+                g.db_write = True
+            elif g.get('replica_key'):
+                return self._db.engines[g.replica_key]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def sqlite_pragmas(config):
+    """Pragmas applied to every new SQLite connection, in order"""
+    return [
+        ('journal_mode', config['SQLITE_JOURNAL_MODE']),
+        ('busy_timeout', config['SQLITE_BUSY_TIMEOUT']),
+        ('synchronous', config['SQLITE_SYNCHRONOUS']),
+        ('cache_size', config['SQLITE_CACHE_SIZE']),
+        ('mmap_size', config['SQLITE_MMAP_SIZE']),
+    ]
+
+
+def init_engines(app, db):
+    """Attach connection hooks to every engine of the app"""
+    pragmas = sqlite_pragmas(app.config)
+
+    def apply_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas:
+            cursor.execute(f'PRAGMA {name}={value}')
+        cursor.close()
+
+    with app.app_context():
+        for engine in db.engines.values():
+            if engine.dialect.name == 'sqlite':
+                event.listen(engine, 'connect', apply_pragmas)
+
+
+def init_read_routing(app):
+    """Pick the engine for each request: a replica for reads, or the primary"""
+    window = app.config['REPLICA_READ_AFTER_WRITE']
+    replicas = [key for key in app.config.get('SQLALCHEMY_BINDS') or {}
+                if key.startswith(REPLICA_BIND_PREFIX)]
+
+    @app.before_request
+    def choose_replica():
+        if (replicas and request.method in ('GET', 'HEAD')
+                and time.time() - session.get('_last_write', 0) > window):
+            g.replica_key = random.choice(replicas)
+
+    @app.after_request
+    def remember_write(response):
+        # Keep this user on the primary until the replicas have caught up
+        if g.get('db_write'):
+            session['_last_write'] = time.time()
+        return response
+
+
+def use_primary():
+    """Send the rest of this request's reads to the primary"""
+    if has_request_context():
+        g.pop('replica_key', None)
+
+
+def copy_primary_to_replicas(app, db):
+    """Copy a SQLite primary into each SQLite replica (stand-in for replication)"""
+    with app.app_context():
+        primary = db.engines[None]
+        replicas = [engine for key, engine in db.engines.items()
+                    if key and key.startswith(REPLICA_BIND_PREFIX)]
+        source = primary.raw_connection()
+        try:
+            for replica in replicas:
+                if primary.dialect.name != 'sqlite' or replica.dialect.name != 'sqlite':
+                    raise ValueError('Replicas can only be copied between SQLite databases')
+                target = replica.raw_connection()
+                try:
+                    source.driver_connection.backup(target.driver_connection)
+                finally:
+                    target.close()
+        finally:
+            source.close()
+        return len(replicas)
@@ -0,0 +1,26 @@
+"""
+Flask extensions, created unbound and initialized by create_app() in app.py
+"""
+
+from flask_login import LoginManager
+from flask_wtf.csrf import CSRFProtect
+from assets import Assets
+from cache import PageCache, IdentityCache
+from metrics import Instrumentation
+
+csrf = CSRFProtect()
+page_cache = PageCache()
+identity_cache = IdentityCache()
+instrumentation = Instrumentation(gauges={
+    'socioplus_identity_cache_hits': ('User loads served from the identity cache.', lambda: identity_cache.hits),
+    'socioplus_identity_cache_misses': ('User loads that queried the database.', lambda: identity_cache.misses),
+    'socioplus_identity_cache_hit_rate': ('Share of user loads served from the cache.',
+                                          lambda: identity_cache.stats()['hit_rate']),
+    'socioplus_identity_cache_size': ('Users currently cached.', lambda: len(identity_cache.backend)),
+})
+assets = Assets()
+
+login_manager = LoginManager()
+login_manager.login_view = 'login'  # Redirect to login if not authenticated
+login_manager.login_message = 'Please log in to access this page.'
+login_manager.login_message_category = 'info'
@@ -1,4 +1,5 @@
 from flask_wtf import FlaskForm
+from flask_wtf.file import FileField, FileRequired, FileAllowed
 from wtforms import StringField, PasswordField, TextAreaField, SelectField, DateField, IntegerField
 from wtforms.validators import DataRequired, Email, EqualTo, Length, ValidationError
 from models import User
@@ -67,4 +68,20 @@ class ApplicationForm(FlaskForm):
     Form for volunteers to apply to opportunities
     """
     message = TextAreaField('Why do you want to volunteer for this opportunity?', 
-                           validators=[DataRequired(), Length(min=20, max=500)])
\ No newline at end of file
+                           validators=[DataRequired(), Length(min=20, max=500)])
+
+
+class SkillsForm(FlaskForm):
+    """
+    Form for volunteers to set the skills they offer
+    """
+    skills = StringField('Your skills (comma-separated)',
+                         validators=[Length(max=500)])
+
+
+class OpportunityImportForm(FlaskForm):
+    """
+    Form for organizations to upload many opportunities at once
+    """
+    file = FileField('CSV or JSON Lines file', 
+                     validators=[FileRequired(), FileAllowed(['csv', 'jsonl'], 'Upload a .csv or .jsonl file')])
@@ -0,0 +1,272 @@
+"""
+Geocoding and "near me" radius search
+
+Free-text locations are geocoded against the offline places table (loaded
+from data/places.csv or a larger gazetteer with `flask --app app
+loadplaces`). Opportunities also store a geohash, so a radius search only
+scans the index ranges of the few geohash cells covering the circle and then
+computes exact distances for those candidates with NumPy.
+"""
+
+import csv
+import math
+import os
+import re
+from sqlalchemy import bindparam, delete, insert, select, union_all, update
+from sqlalchemy.orm import joinedload
+from models import db, User, Opportunity, Place, SchemaVersion
+
+PLACES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'places.csv')
+
+EARTH_RADIUS_KM = 6371.0088
+GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+GEOHASH_PRECISION = 9  # About 5 m cells
+# Sorts after every geohash character, so [prefix, prefix + END) is a prefix range
+GEOHASH_END = '{'
+# Most cells a radius search scans; larger circles use coarser cells
+MAX_COVER_CELLS = 16
+
+# Radius search limits, in km
+DEFAULT_RADIUS_KM = 25
+MAX_RADIUS_KM = 500
+RADIUS_CHOICES_KM = (5, 10, 25, 50, 100, 250)
+
+# Rows per geocoding backfill batch
+BACKFILL_BATCH = 1000
+
+_ZIP_CODE = re.compile(r'\s+\d{5}(-\d{4})?$')
+
+
+# ========== GEOHASH ==========
+
+def geohash_encode(latitude, longitude, precision=GEOHASH_PRECISION):
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars = []
+    bits, bit_count, even = 0, 0, True
+    while len(chars) < precision:
+        value, interval = (longitude, lon_range) if even else (latitude, lat_range)
+        mid = (interval[0] + interval[1]) / 2
+        bits <<= 1
+        if value >= mid:
+            bits |= 1
+            interval[0] = mid
+        else:
+            interval[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(GEOHASH_ALPHABET[bits])
+            bits, bit_count = 0, 0
+    return ''.join(chars)
+
+
+def cell_size(precision):
+    """(height, width) of a geohash cell in degrees"""
+    lon_bits = (5 * precision + 1) // 2
+    lat_bits = 5 * precision // 2
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lon_bits
+
+
+def covering_prefixes(latitude, longitude, radius_km):
+    """Geohash prefixes whose cells together cover the circle"""
+    dlat = math.degrees(radius_km / EARTH_RADIUS_KM)
+    min_lat, max_lat = max(latitude - dlat, -90.0), min(latitude + dlat, 90.0)
+    if max(abs(min_lat), abs(max_lat)) >= 89.0:
+        return ['']  # Too close to a pole for a longitude band; scan everything
+    dlon = math.degrees(radius_km / (EARTH_RADIUS_KM * math.cos(math.radians(max(abs(min_lat), abs(max_lat))))))
+    if dlon >= 180.0:
+        return ['']
+
+    # The finest cells that still cover the bounding box in a few prefixes
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        height, width = cell_size(precision)
+        rows = math.floor(max_lat / height) - math.floor(min_lat / height) + 1
+        columns = math.floor((longitude + dlon) / width) - math.floor((longitude - dlon) / width) + 1
+        if rows * columns <= MAX_COVER_CELLS:
+            break
+
+    # Sampling the box at cell-size steps (plus its far edges) hits every cell
+    lats = [min_lat + row * height for row in range(rows)] + [max_lat]
+    lons = [longitude - dlon + column * width for column in range(columns)] + [longitude + dlon]
+    return sorted({
+        geohash_encode(min(lat, max_lat), (lon + 180.0) % 360.0 - 180.0, precision)  # Wrap the antimeridian
+        for lat in lats for lon in lons
+    })
+
+
+def distances_km(latitude, longitude, latitudes, longitudes):
+    """Great-circle distances from one point to arrays of points (haversine)"""
+    import numpy as np  # Imported on first use, keeping it out of app startup
+    lat1, lon1 = math.radians(latitude), math.radians(longitude)
+    lat2, lon2 = np.radians(latitudes), np.radians(longitudes)
+    a = np.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+# ========== GEOCODING ==========
+
+def normalize(name):
+    """Lookup key for a place name: lowercase, single spaces, no ZIP code"""
+    parts = [_ZIP_CODE.sub('', ' '.join(part.split()).lower()) for part in name.split(',')]
+    return ', '.join(part for part in parts if part)
+
+
+def candidate_names(location):
+    """Keys to try for a free-text location, most specific first
+    ('12 Main St, Austin, TX' -> '12 main st, austin, tx', 'austin, tx', 'tx')"""
+    parts = normalize(location or '').split(', ')
+    return [', '.join(parts[i:]) for i in range(len(parts)) if parts[i]]
+
+
+def geocode(location):
+    """(latitude, longitude) of a free-text location, or None"""
+    names = candidate_names(location)
+    if not names:
+        return None
+    places = {place.name: place for place in Place.query.filter(Place.name.in_(names))}
+    for name in names:
+        if name in places:
+            return places[name].latitude, places[name].longitude
+    return None
+
+
+def locate(obj):
+    """Set a user's or opportunity's coordinates from its location"""
+    coordinates = geocode(obj.location)
+    obj.latitude, obj.longitude = coordinates or (None, None)
+    if isinstance(obj, Opportunity):
+        obj.geohash = geohash_encode(*coordinates) if coordinates else None
+
+
+def load_places(path=PLACES_FILE, batch_size=5000):
+    """Replace the places table with a CSV of name,latitude,longitude (caller commits)"""
+    db.session.execute(delete(Place))
+    seen = set()
+    batch = []
+    count = 0
+    with open(path, encoding='utf-8-sig', newline='') as f:
+        for row in csv.DictReader(f):
+            name = normalize(row['name'])
+            if not name or name in seen:
+                continue
+            seen.add(name)
+            batch.append({'name': name, 'latitude': float(row['latitude']), 'longitude': float(row['longitude'])})
+            if len(batch) >= batch_size:
+                db.session.execute(insert(Place), batch)
+                count += len(batch)
+                batch = []
+    if batch:
+        db.session.execute(insert(Place), batch)
+        count += len(batch)
+    return count
+
+
+def ensure_places():
+    """Load the bundled places if the table is empty (caller commits)"""
+    if db.session.scalar(select(Place.id).limit(1)) is None:
+        load_places()
+
+
+class Geocoder:
+    """Geocodes many locations with the whole places table in memory"""
+
+    def __init__(self):
+        self.places = {name: (lat, lon) for name, lat, lon in db.session.execute(
+            select(Place.name, Place.latitude, Place.longitude))}
+        self._cache = {}
+
+    def lookup(self, location):
+        """(latitude, longitude) of a free-text location, or None"""
+        if location not in self._cache:
+            self._cache[location] = next(
+                (self.places[name] for name in candidate_names(location) if name in self.places), None)
+        return self._cache[location]
+
+    def columns(self, location, geohash=True):
+        """Coordinate column values for a row with this location"""
+        latitude, longitude = self.lookup(location) or (None, None)
+        values = {'latitude': latitude, 'longitude': longitude}
+        if geohash:
+            values['geohash'] = geohash_encode(latitude, longitude) if latitude is not None else None
+        return values
+
+
+def backfill(model, only_missing=True):
+    """
+    Geocode every user or opportunity (or only those without coordinates)
+    in batches. Returns how many rows have coordinates afterwards.
+    """
+    geocoder = Geocoder()
+    table = model.__table__
+    located = 0
+    last_id = 0
+    while True:
+        query = select(model.id, model.location).where(model.id > last_id).order_by(model.id).limit(BACKFILL_BATCH)
+        if only_missing:
+            query = query.where(model.latitude.is_(None))
+        rows = db.session.execute(query).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+
+        values = []
+        for row in rows:
+            columns = geocoder.columns(row.location, geohash=model is Opportunity)
+            if columns['latitude'] is not None:
+                located += 1
+            elif only_missing:
+                continue
+            values.append({'row_id': row.id, **columns})
+        if values:
+            # SET columns come from the keys of each parameter dict
+            db.session.execute(update(table).where(table.c.id == bindparam('row_id')), values)
+        db.session.commit()
+    return located
+
+
+@SchemaVersion.upgrade('geocode-users-and-opportunities')
+def backfill_coordinates():
+    """Geocode the users and opportunities created before coordinates were stored"""
+    ensure_places()
+    db.session.commit()
+    backfill(User)
+    backfill(Opportunity)
+
+
+# ========== RADIUS SEARCH ==========
+
+def opportunities_near(latitude, longitude, radius_km, limit, offset=0):
+    """
+    Open opportunities within radius_km, nearest first. Returns
+    ([(opportunity, distance in km)], number within the radius).
+    """
+    import numpy as np
+    # One index range scan per covering cell (the cells don't overlap)
+    rows = db.session.execute(union_all(*(
+        select(Opportunity.id, Opportunity.latitude, Opportunity.longitude)
+        .where(Opportunity.status == 'open',
+               Opportunity.geohash >= prefix, Opportunity.geohash < prefix + GEOHASH_END)
+        for prefix in covering_prefixes(latitude, longitude, radius_km)
+    ))).all()
+    if not rows:
+        return [], 0
+
+    ids, latitudes, longitudes = (np.array(column) for column in zip(*rows))
+    distances = distances_km(latitude, longitude, latitudes, longitudes)
+    inside = np.flatnonzero(distances <= radius_km)
+
+    # Only the rows up to the requested page need sorting
+    wanted = min(offset + limit, len(inside))
+    if wanted <= 0:
+        return [], len(inside)
+    if wanted < len(inside):
+        inside_top = inside[np.argpartition(distances[inside], wanted - 1)[:wanted]]
+    else:
+        inside_top = inside
+    page = inside_top[np.lexsort((ids[inside_top], distances[inside_top]))][offset:]
+
+    page_ids = ids[page].tolist()
+    opportunities = {opp.id: opp for opp in Opportunity.query.options(
+        joinedload(Opportunity.organization)).filter(Opportunity.id.in_(page_ids))}
+    return [(opportunities[opp_id], float(distances[i])) for opp_id, i in zip(page_ids, page)
+            if opp_id in opportunities], len(inside)
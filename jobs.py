@@ -0,0 +1,183 @@
+"""
+Durable background jobs stored in the database
+
+Routes enqueue jobs in the same transaction as the change that caused
+them, so a job only becomes visible to the worker once that change commits
+and is dropped if it rolls back. `flask --app app worker` runs due jobs
+(no external broker needed), retrying failures with exponential backoff.
+Kinds registered with a batch size are claimed many at a time so their
+handler can combine them, e.g. one email per recipient. Periodic kinds are
+scheduled by the worker itself: it queues one when it starts if none is
+waiting, and the next one each time a run finishes.
+"""
+
+import json
+import os
+import random
+import signal
+import socket
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import delete, insert, select, update
+from models import db, Job
+
+# kind -> (handler, batch size)
+HANDLERS = {}
+# Periodic kind -> name of the config setting with the seconds between runs
+PERIODIC = {}
+
+
+def handler(kind, batch_size=1):
+    """
+    Register the handler of a job kind. It is called with a list of
+    (job ID, payload) pairs and returns {job ID: error} for the jobs that
+    failed; raising fails the whole batch.
+    """
+    def decorator(func):
+        HANDLERS[kind] = (func, batch_size)
+        return func
+    return decorator
+
+
+def periodic(kind, interval_setting):
+    """
+    Register the handler of a job kind the worker runs every
+    app.config[interval_setting] seconds (called with a single job)
+    """
+    def decorator(func):
+        HANDLERS[kind] = (func, 1)
+        PERIODIC[kind] = interval_setting
+        return func
+    return decorator
+
+
+def enqueue(kind, payloads, delay=0):
+    """Add one job per payload to the current transaction (the caller commits)"""
+    if not payloads:
+        return
+    run_at = datetime.utcnow() + timedelta(seconds=delay)
+    db.session.execute(insert(Job), [
+        {'kind': kind, 'payload': json.dumps(payload), 'status': 'queued', 'attempts': 0,
+         'run_at': run_at, 'created_at': datetime.utcnow()}
+        for payload in payloads
+    ])
+
+
+class Worker:
+    """Runs due jobs until stopped"""
+
+    def __init__(self, app, worker_id=None):
+        self.app = app
+        self.worker_id = worker_id or f'{socket.gethostname()}:{os.getpid()}'
+        self.max_attempts = app.config['JOB_MAX_ATTEMPTS']
+        self.backoff = app.config['JOB_RETRY_BACKOFF']
+        self.max_backoff = app.config['JOB_RETRY_BACKOFF_MAX']
+        self.lock_timeout = app.config['JOB_LOCK_TIMEOUT']
+        self.poll_interval = app.config['JOB_POLL_INTERVAL']
+        self.stopping = False
+
+    def stop(self, *args):
+        """Finish the current batch, then exit"""
+        self.stopping = True
+
+    def run(self, once=False):
+        """Poll for jobs; with once=True, exit when none are due"""
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        with self.app.app_context():
+            for kind in PERIODIC:
+                self.schedule(kind, delay=0)
+            db.session.commit()
+        while not self.stopping:
+            with self.app.app_context():
+                ran = self.run_due()
+            if not ran:
+                if once:
+                    break
+                time.sleep(self.poll_interval)
+
+    def run_due(self):
+        """Run one batch of due jobs; returns how many ran"""
+        self.requeue_stale()
+        claimed = self.claim()
+        if not claimed:
+            return 0
+
+        kind = claimed[0].kind
+        func, _ = HANDLERS[kind]
+        batch = [(job.id, json.loads(job.payload)) for job in claimed]
+        try:
+            errors = func(batch) or {}
+        except Exception as error:
+            self.app.logger.exception('Job batch %s failed', kind)
+            db.session.rollback()
+            errors = {job.id: f'{type(error).__name__}: {error}' for job in claimed}
+
+        done = [job.id for job in claimed if job.id not in errors]
+        if done:
+            db.session.execute(delete(Job).where(Job.id.in_(done)))
+        for job in claimed:
+            if job.id in errors:
+                self.retry_later(job, errors[job.id])
+        if kind in PERIODIC:
+            self.schedule(kind, delay=self.app.config[PERIODIC[kind]])
+        db.session.commit()
+        return len(claimed)
+
+    def schedule(self, kind, delay):
+        """Queue the next run of a periodic job unless one is already waiting"""
+        waiting = db.session.scalar(select(Job.id).where(Job.kind == kind, Job.status == 'queued').limit(1))
+        if waiting is None:
+            enqueue(kind, [{}], delay=delay)
+
+    def claim(self):
+        """Mark a batch of due jobs of one kind as running by this worker"""
+        now = datetime.utcnow()
+        due = (Job.status == 'queued', Job.run_at <= now, Job.kind.in_(list(HANDLERS)))
+        kind = db.session.scalar(select(Job.kind).where(*due).order_by(Job.run_at, Job.id).limit(1))
+        if kind is None:
+            db.session.commit()
+            return []
+
+        _, batch_size = HANDLERS[kind]
+        # Skip rows other workers hold where the database supports it
+        ids = db.session.scalars(
+            select(Job.id).where(*due, Job.kind == kind).order_by(Job.run_at, Job.id)
+            .limit(batch_size).with_for_update(skip_locked=True)
+        ).all()
+        statement = (
+            update(Job)
+            .where(Job.id.in_(ids), Job.status == 'queued')
+            .values(status='running', locked_by=self.worker_id, locked_at=now, attempts=Job.attempts + 1)
+            .execution_options(synchronize_session=False)
+        )
+        if db.session.get_bind().dialect.update_returning:
+            # Another worker may have claimed some since they were read
+            ids = db.session.scalars(statement.returning(Job.id)).all()
+        else:
+            db.session.execute(statement)
+        db.session.commit()
+        if not ids:
+            return []
+        return db.session.scalars(select(Job).where(Job.id.in_(ids)).order_by(Job.id)).all()
+
+    def retry_later(self, job, error):
+        """Requeue a failed job with exponential backoff, or give up on it"""
+        values = {'status': 'queued', 'locked_by': None, 'locked_at': None, 'last_error': error[:2000]}
+        if job.attempts >= self.max_attempts:
+            values['status'] = 'failed'
+            self.app.logger.error('Job %d (%s) failed after %d attempts: %s', job.id, job.kind, job.attempts, error)
+        else:
+            delay = min(self.backoff * 2 ** (job.attempts - 1), self.max_backoff)
+            values['run_at'] = datetime.utcnow() + timedelta(seconds=delay * random.uniform(0.5, 1.0))
+        db.session.execute(update(Job).where(Job.id == job.id).values(values))
+
+    def requeue_stale(self):
+        """Requeue jobs whose worker died while running them"""
+        cutoff = datetime.utcnow() - timedelta(seconds=self.lock_timeout)
+        db.session.execute(
+            update(Job)
+            .where(Job.status == 'running', Job.locked_at < cutoff)
+            .values(status='queued', locked_by=None, locked_at=None)
+        )
+        db.session.commit()
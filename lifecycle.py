@@ -0,0 +1,130 @@
+"""
+Opportunity lifecycle: completing past opportunities and archiving old ones
+
+Once an opportunity's date has passed it becomes 'completed', which takes
+it out of every status='open' query (browse, search, near me, homepage).
+Completed opportunities older than ARCHIVE_AFTER_DAYS are moved, with their
+applications, into the archive tables, so the live tables only hold
+current data while the dashboards can still show past activity. The
+worker runs both every LIFECYCLE_INTERVAL seconds; `flask --app app
+lifecycle` runs them once. Each batch is its own short transaction.
+"""
+
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import delete, func, insert, literal, select, update
+from models import (db, Opportunity, Application, ArchivedOpportunity, ArchivedApplication,
+                    SiteStats, opportunity_skills)
+from skills import recommender
+import jobs
+import search
+
+# Statuses that become 'completed' once the date has passed
+EXPIRING = ('open', 'closed')
+
+ARCHIVED_OPPORTUNITY_COLUMNS = ('id', 'title', 'description', 'location', 'date', 'duration',
+                                'skills_required', 'spots_available', 'status', 'created_at', 'org_id')
+ARCHIVED_APPLICATION_COLUMNS = ('id', 'message', 'status', 'applied_at', 'decided_at', 'user_id',
+                                'opportunity_id')
+
+
+def complete_expired(today=None, batch_size=500):
+    """
+    Mark open and closed opportunities dated before today (UTC, like every
+    other timestamp) as completed. Returns how many changed.
+    """
+    today = today or datetime.utcnow().date()
+    returning = db.session.get_bind().dialect.update_returning
+    total = 0
+    for status in EXPIRING:
+        while True:
+            opp_ids = db.session.scalars(
+                select(Opportunity.id).where(Opportunity.status == status, Opportunity.date < today)
+                .order_by(Opportunity.date, Opportunity.id).limit(batch_size).with_for_update()
+            ).all()
+            if not opp_ids:
+                break
+            statement = (
+                update(Opportunity)
+                .where(Opportunity.id.in_(opp_ids), Opportunity.status == status)
+                .values(status='completed')
+                .execution_options(synchronize_session=False)
+            )
+            if returning:
+                # Skip any that changed status since they were read
+                opp_ids = db.session.scalars(statement.returning(Opportunity.id)).all()
+            else:
+                db.session.execute(statement)
+            if status == 'open':
+                search.sync_opportunities(opp_ids)
+                SiteStats.adjust(open_opportunities=-len(opp_ids))
+            db.session.commit()
+            if status == 'open':
+                recommender.opportunities_closed(opp_ids)
+            total += len(opp_ids)
+    return total
+
+
+def archive_completed(before, batch_size=500):
+    """
+    Move completed opportunities dated before `before`, and their
+    applications, to the archive tables. Returns how many were archived.
+    """
+    # Never archive the newest row of either table: some databases (SQLite,
+    # older MySQL after a restart) hand a deleted largest ID out again
+    newest_opportunity = db.session.scalar(select(func.max(Opportunity.id)))
+    newest_application = db.session.scalar(select(func.max(Application.id)))
+    keep = select(Application.opportunity_id).where(Application.id == newest_application)
+    now = datetime.utcnow()
+    total = 0
+    while True:
+        opp_ids = db.session.scalars(
+            select(Opportunity.id)
+            .where(Opportunity.status == 'completed', Opportunity.date < before,
+                   Opportunity.id != newest_opportunity, Opportunity.id.not_in(keep))
+            .order_by(Opportunity.date, Opportunity.id).limit(batch_size).with_for_update()
+        ).all()
+        if not opp_ids:
+            return total
+
+        opportunity_columns = [getattr(Opportunity, name) for name in ARCHIVED_OPPORTUNITY_COLUMNS]
+        db.session.execute(insert(ArchivedOpportunity).from_select(
+            [*ARCHIVED_OPPORTUNITY_COLUMNS, 'archived_at'],
+            select(*opportunity_columns, literal(now)).where(Opportunity.id.in_(opp_ids))
+        ))
+        db.session.execute(insert(ArchivedApplication).from_select(
+            ARCHIVED_APPLICATION_COLUMNS,
+            select(*(getattr(Application, name) for name in ARCHIVED_APPLICATION_COLUMNS))
+            .where(Application.opportunity_id.in_(opp_ids))
+        ))
+        db.session.execute(delete(opportunity_skills).where(opportunity_skills.c.opportunity_id.in_(opp_ids)))
+        db.session.execute(delete(Application).where(Application.opportunity_id.in_(opp_ids)))
+        db.session.execute(delete(Opportunity).where(Opportunity.id.in_(opp_ids)))
+        db.session.commit()
+        total += len(opp_ids)
+
+
+def run(config):
+    """Complete expired opportunities, then archive old completed ones"""
+    batch_size = config['LIFECYCLE_BATCH_SIZE']
+    today = datetime.utcnow().date()
+    completed = complete_expired(today, batch_size)
+    archived = archive_completed(today - timedelta(days=config['ARCHIVE_AFTER_DAYS']), batch_size)
+    return completed, archived
+
+
+def invalidate_pages():
+    """Clear the page cache, if this process shares it with the web processes"""
+    page_cache = current_app.extensions['page_cache']
+    # A per-process cache here is one no web process reads; theirs drop the
+    # changed pages within CACHE_DEFAULT_TIMEOUT
+    if page_cache.backend.shared:
+        page_cache.invalidate()
+
+
+@jobs.periodic('lifecycle', 'LIFECYCLE_INTERVAL')
+def run_lifecycle(batch):
+    completed, archived = run(current_app.config)
+    if completed or archived:
+        current_app.logger.info('Completed %d and archived %d opportunities', completed, archived)
+        invalidate_pages()
@@ -0,0 +1,105 @@
+"""
+Outgoing email over SMTP, plus a local SMTP stand-in for development
+
+The job worker sends a batch of messages over one SMTP connection. Run
+`flask --app app mailsink` to accept mail on MAIL_SERVER:MAIL_PORT and
+print it instead of delivering it.
+"""
+
+import smtplib
+import socketserver
+import threading
+from email import message_from_bytes, policy
+from email.message import EmailMessage
+
+
+def build_message(config, to, subject, body):
+    message = EmailMessage()
+    message['From'] = config['MAIL_DEFAULT_SENDER']
+    message['To'] = to
+    message['Subject'] = subject
+    message.set_content(body)
+    return message
+
+
+def send_messages(config, messages):
+    """
+    Send (key, message) pairs over one connection. Returns {key: error} for
+    messages the server refused; connection failures raise.
+    """
+    errors = {}
+    if not messages:
+        return errors
+    with smtplib.SMTP(config['MAIL_SERVER'], config['MAIL_PORT'], timeout=config['MAIL_TIMEOUT']) as smtp:
+        if config['MAIL_USE_TLS']:
+            smtp.starttls()
+        if config['MAIL_USERNAME']:
+            smtp.login(config['MAIL_USERNAME'], config['MAIL_PASSWORD'])
+        for key, message in messages:
+            try:
+                smtp.send_message(message)
+            except (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, smtplib.SMTPDataError) as error:
+                errors[key] = f'{type(error).__name__}: {error}'
+    return errors
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    """Just enough SMTP to accept mail from smtplib"""
+
+    def reply(self, line):
+        self.wfile.write(line.encode() + b'\r\n')
+
+    def handle(self):
+        self.reply('220 localhost Socio+ mail sink')
+        sender, recipients = None, []
+        for raw in self.rfile:
+            command = raw.decode('utf-8', 'replace').strip()
+            verb = command[:4].upper()
+            if verb in ('EHLO', 'HELO'):
+                self.reply('250 localhost')
+            elif verb == 'MAIL':
+                sender, recipients = command[10:], []
+                self.reply('250 OK')
+            elif verb == 'RCPT':
+                recipients.append(command[8:])
+                self.reply('250 OK')
+            elif verb == 'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                lines = []
+                for data in self.rfile:
+                    if data.rstrip(b'\r\n') == b'.':
+                        break
+                    lines.append(data[1:] if data.startswith(b'..') else data)
+                self.server.deliver(sender, recipients, message_from_bytes(b''.join(lines), policy=policy.default))
+                self.reply('250 OK: queued')
+            elif verb == 'RSET':
+                sender, recipients = None, []
+                self.reply('250 OK')
+            elif verb == 'NOOP':
+                self.reply('250 OK')
+            elif verb == 'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('502 Command not implemented')
+
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    """
+    Local SMTP server that keeps every message it receives (and passes it
+    to on_message, if given) instead of delivering it
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host='localhost', port=1025, on_message=None):
+        super().__init__((host, port), _SMTPHandler)
+        self.messages = []
+        self.on_message = on_message
+        self._lock = threading.Lock()
+
+    def deliver(self, sender, recipients, message):
+        with self._lock:
+            self.messages.append(message)
+        if self.on_message:
+            self.on_message(sender, recipients, message)
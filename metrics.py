@@ -0,0 +1,196 @@
+"""
+Per-request instrumentation and Prometheus metrics
+
+Every request records how many SQL queries it ran and how long they took,
+how long templates took to render and how long password hashing took. The
+totals are sent back in a Server-Timing header, slow queries and requests
+are logged, and per-endpoint histograms are served at /metrics in the
+Prometheus text format. Metrics are kept per worker process.
+"""
+
+import bisect
+import threading
+import time
+from flask import Response, g, has_request_context, request, template_rendered, before_render_template
+from sqlalchemy import event
+
+# Seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    pairs = ','.join(f'{name}="{str(value).replace(chr(34), chr(39))}"' for name, value in zip(names, values))
+    return '{' + pairs + '}'
+
+
+class Counter:
+    """Monotonic counter with optional labels"""
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, *label_values):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for label_values, value in sorted(self._values.items()):
+                lines.append(f'{self.name}{_format_labels(self.labels, label_values)} {value}')
+        return lines
+
+
+class Histogram:
+    """Cumulative-bucket histogram with optional labels"""
+
+    def __init__(self, name, help_text, buckets, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.labels = labels
+        self._series = {}  # label values -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.setdefault(label_values, [0] * (len(self.buckets) + 2))
+            series[index] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            for label_values, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + ('+Inf',), series[:-1]):
+                    cumulative += count
+                    labels = _format_labels(self.labels + ('le',), label_values + (bound,))
+                    lines.append(f'{self.name}_bucket{labels} {cumulative}')
+                labels = _format_labels(self.labels, label_values)
+                lines.append(f'{self.name}_sum{labels} {series[-1]}')
+                lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+
+REQUESTS = Counter('socioplus_requests_total', 'HTTP requests handled.', ('endpoint', 'method', 'status'))
+REQUEST_DURATION = Histogram('socioplus_request_duration_seconds', 'Time to handle a request.',
+                             LATENCY_BUCKETS, ('endpoint', 'method'))
+REQUEST_QUERIES = Histogram('socioplus_request_db_queries', 'SQL queries per request.',
+                            QUERY_COUNT_BUCKETS, ('endpoint',))
+REQUEST_DB_TIME = Histogram('socioplus_request_db_seconds', 'Time spent in SQL queries per request.',
+                            LATENCY_BUCKETS, ('endpoint',))
+TEMPLATE_RENDER = Histogram('socioplus_template_render_seconds', 'Time to render a template.',
+                            LATENCY_BUCKETS, ('template',))
+PASSWORD_HASHING = Histogram('socioplus_password_hash_seconds', 'Time to hash or verify a password.',
+                             LATENCY_BUCKETS)
+SLOW_QUERIES = Counter('socioplus_slow_queries_total', 'SQL queries slower than SLOW_QUERY_THRESHOLD_MS.')
+
+METRICS = [REQUESTS, REQUEST_DURATION, REQUEST_QUERIES, REQUEST_DB_TIME, TEMPLATE_RENDER,
+           PASSWORD_HASHING, SLOW_QUERIES]
+
+
+def record_password_hash(seconds):
+    """Record time spent hashing or verifying a password"""
+    PASSWORD_HASHING.observe(seconds)
+    if has_request_context():
+        g.hash_time = g.get('hash_time', 0.0) + seconds
+
+
+class Instrumentation:
+    """Hooks the request, SQL and template timings into an app"""
+
+    def __init__(self, app=None, db=None, gauges=None):
+        self.gauges = gauges or {}
+        if app is not None:
+            self.init_app(app, db)
+
+    def init_app(self, app, db):
+        slow_query = app.config.get('SLOW_QUERY_THRESHOLD_MS', 100) / 1000
+        slow_request = app.config.get('SLOW_REQUEST_THRESHOLD_MS', 500) / 1000
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+        def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            duration = time.perf_counter() - conn.info['query_start'].pop()
+            if has_request_context():
+                g.db_queries = g.get('db_queries', 0) + 1
+                g.db_time = g.get('db_time', 0.0) + duration
+            if duration > slow_query:
+                SLOW_QUERIES.inc()
+                app.logger.warning('Slow query (%.1f ms): %s', duration * 1000, ' '.join(statement.split())[:500])
+
+        with app.app_context():
+            for engine in db.engines.values():
+                event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+                event.listen(engine, 'after_cursor_execute', after_cursor_execute)
+
+        def before_render(sender, template, context, **extra):
+            g.render_start = time.perf_counter()
+
+        def after_render(sender, template, context, **extra):
+            duration = time.perf_counter() - g.pop('render_start', time.perf_counter())
+            g.render_time = g.get('render_time', 0.0) + duration
+            TEMPLATE_RENDER.observe(duration, template.name)
+
+        before_render_template.connect(before_render, app, weak=False)
+        template_rendered.connect(after_render, app, weak=False)
+
+        @app.before_request
+        def start_timer():
+            g.request_start = time.perf_counter()
+
+        @app.after_request
+        def record_request(response):
+            if 'request_start' not in g:
+                return response
+            total = time.perf_counter() - g.request_start
+            endpoint = request.endpoint or 'unknown'
+            queries = g.get('db_queries', 0)
+            db_time = g.get('db_time', 0.0)
+            render_time = g.get('render_time', 0.0)
+            hash_time = g.get('hash_time', 0.0)
+
+            REQUESTS.inc(1, endpoint, request.method, response.status_code)
+            REQUEST_DURATION.observe(total, endpoint, request.method)
+            REQUEST_QUERIES.observe(queries, endpoint)
+            REQUEST_DB_TIME.observe(db_time, endpoint)
+
+            timings = [f'db;dur={db_time * 1000:.1f};desc="{queries} queries"']
+            if render_time:
+                timings.append(f'render;dur={render_time * 1000:.1f}')
+            if hash_time:
+                timings.append(f'hash;dur={hash_time * 1000:.1f}')
+            timings.append(f'total;dur={total * 1000:.1f}')
+            response.headers['Server-Timing'] = ', '.join(timings)
+
+            if total > slow_request:
+                app.logger.warning(
+                    'Slow request (%.1f ms): %s %s - %d queries in %.1f ms, render %.1f ms, hashing %.1f ms',
+                    total * 1000, request.method, request.full_path.rstrip('?'), queries,
+                    db_time * 1000, render_time * 1000, hash_time * 1000
+                )
+            return response
+
+        if app.config.get('METRICS_ENABLED', True):
+            app.add_url_rule('/metrics', 'metrics', self.metrics_view)
+
+        app.extensions['instrumentation'] = self
+
+    def metrics_view(self):
+        """Prometheus text exposition of every metric"""
+        lines = []
+        for metric in METRICS:
+            lines.extend(metric.render())
+        for name, (help_text, read) in sorted(self.gauges.items()):
+            lines.extend([f'# HELP {name} {help_text}', f'# TYPE {name} gauge', f'{name} {read()}'])
+        return Response('\n'.join(lines) + '\n', mimetype='text/plain; version=0.0.4')
@@ -1,9 +1,44 @@
+import hashlib
+import os
+from contextlib import contextmanager
+from flask import current_app
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
-from werkzeug.security import generate_password_hash, check_password_hash
+from sqlalchemy import insert, inspect, text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.schema import CreateColumn
+from passwords import password_hasher
+from database import RoutingSession
 from datetime import datetime
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+
+def insert_ignoring_duplicates(table):
+    """INSERT that skips rows violating a unique constraint"""
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+        return sqlite_insert(table).on_conflict_do_nothing()
+    if dialect == 'postgresql':
+        # Importing the PostgreSQL dialect is slow, so only where it's used
+        from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+        return postgresql_insert(table).on_conflict_do_nothing()
+    if dialect in ('mysql', 'mariadb'):
+        return insert(table).prefix_with('IGNORE')
+    return insert(table)
+
+# Skills of each volunteer and the skills each opportunity asks for
+user_skills = db.Table(
+    'user_skills',
+    db.Column('user_id', db.Integer, db.ForeignKey('users.id'), primary_key=True),
+    db.Column('skill_id', db.Integer, db.ForeignKey('skills.id'), primary_key=True, index=True)
+)
+opportunity_skills = db.Table(
+    'opportunity_skills',
+    db.Column('opportunity_id', db.Integer, db.ForeignKey('opportunities.id'), primary_key=True),
+    db.Column('skill_id', db.Integer, db.ForeignKey('skills.id'), primary_key=True, index=True)
+)
 
 class User(UserMixin, db.Model):
     """
@@ -19,6 +54,9 @@ class User(UserMixin, db.Model):
     role = db.Column(db.String(20), nullable=False)  # 'volunteer' or 'organization'
     phone = db.Column(db.String(20))
     location = db.Column(db.String(100))
+    # Geocoded from location (see geo.py); NULL when it isn't a known place
+    latitude = db.Column(db.Float)
+    longitude = db.Column(db.Float)
     bio = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
@@ -27,14 +65,20 @@ class User(UserMixin, db.Model):
     opportunities = db.relationship('Opportunity', backref='organization', lazy=True, cascade='all, delete-orphan')
     # If user is a volunteer, they can submit applications
     applications = db.relationship('Application', backref='volunteer', lazy=True, cascade='all, delete-orphan')
+    # Volunteer skill profile, used for recommendations
+    skills = db.relationship('Skill', secondary=user_skills, lazy=True)
     
     def set_password(self, password):
         """Hash password before storing"""
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = password_hasher.hash(password)
     
     def check_password(self, password):
         """Verify password against hash"""
-        return check_password_hash(self.password_hash, password)
+        return password_hasher.verify(self.password_hash, password)
+    
+    def password_needs_rehash(self):
+        """Check if the stored hash uses an outdated method or cost"""
+        return password_hasher.needs_rehash(self.password_hash)
     
     def __repr__(self):
         return f'<User {self.email} ({self.role})>'
@@ -54,14 +98,32 @@ class Opportunity(db.Model):
     duration = db.Column(db.String(50))  # e.g., "3 hours", "Full day"
     skills_required = db.Column(db.String(200))
     spots_available = db.Column(db.Integer, default=1)
-    status = db.Column(db.String(20), default='open')  # 'open', 'closed', 'completed'
+    # 'open', 'closed' or 'completed' (set once the date has passed, see lifecycle.py)
+    status = db.Column(db.String(20), default='open')
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    # Geocoded from location (see geo.py); NULL when it isn't a known place
+    latitude = db.Column(db.Float)
+    longitude = db.Column(db.Float)
+    geohash = db.Column(db.String(12))
+    
     # Foreign key to organization that posted it
-    org_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    org_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
     
     # Relationships
     applications = db.relationship('Application', backref='opportunity', lazy=True, cascade='all, delete-orphan')
+    # Parsed from skills_required (see skills.py)
+    skills = db.relationship('Skill', secondary=opportunity_skills, lazy=True)
+    
+    # Browse page filters on status and pages through (date, id) with a keyset cursor;
+    # the homepage lists the most recently created open opportunities; radius
+    # search scans geohash prefix ranges of open opportunities (the index
+    # covers the coordinates, so candidates are read from the index alone)
+    __table_args__ = (
+        db.Index('ix_opportunities_status_date_id', 'status', 'date', 'id'),
+        db.Index('ix_opportunities_status_created_at', 'status', 'created_at'),
+        db.Index('ix_opportunities_status_geohash', 'status', 'geohash', 'latitude', 'longitude'),
+    )
     
     def __repr__(self):
         return f'<Opportunity {self.title}>'
@@ -75,8 +137,9 @@ class Application(db.Model):
     
     id = db.Column(db.Integer, primary_key=True)
     message = db.Column(db.Text)  # Cover letter / why they want to volunteer
-    status = db.Column(db.String(20), default='pending')  # 'pending', 'accepted', 'rejected'
+    status = db.Column(db.String(20), default='pending')  # 'pending', 'accepted', 'rejected', 'waitlisted'
     applied_at = db.Column(db.DateTime, default=datetime.utcnow)
+    decided_at = db.Column(db.DateTime)  # Last accepted or rejected
     
     # Foreign keys
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -86,4 +149,356 @@ class Application(db.Model):
     __table_args__ = (db.UniqueConstraint('user_id', 'opportunity_id', name='unique_application'),)
     
     def __repr__(self):
-        return f'<Application {self.id} - Status: {self.status}>'
\ No newline at end of file
+        return f'<Application {self.id} - Status: {self.status}>'
+
+
+class ArchivedOpportunity(db.Model):
+    """
+    A completed opportunity moved out of the live tables (see lifecycle.py),
+    kept for the dashboards' history. Keeps its original ID.
+    """
+    __tablename__ = 'archived_opportunities'
+    
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    title = db.Column(db.String(200), nullable=False)
+    description = db.Column(db.Text, nullable=False)
+    location = db.Column(db.String(100), nullable=False)
+    date = db.Column(db.Date, nullable=False)
+    duration = db.Column(db.String(50))
+    skills_required = db.Column(db.String(200))
+    spots_available = db.Column(db.Integer)
+    status = db.Column(db.String(20), nullable=False)
+    created_at = db.Column(db.DateTime)
+    archived_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    org_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    
+    organization = db.relationship('User', lazy=True)
+    applications = db.relationship('ArchivedApplication', backref='opportunity', lazy=True)
+    
+    # Dashboards list an organization's past opportunities, latest first
+    __table_args__ = (db.Index('ix_archived_opportunities_org_id_date', 'org_id', 'date'),)
+    
+    def __repr__(self):
+        return f'<ArchivedOpportunity {self.title}>'
+
+
+class ArchivedApplication(db.Model):
+    """
+    An application to an archived opportunity. Keeps its original ID.
+    """
+    __tablename__ = 'archived_applications'
+    
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    message = db.Column(db.Text)
+    status = db.Column(db.String(20), nullable=False)
+    applied_at = db.Column(db.DateTime)
+    decided_at = db.Column(db.DateTime)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    opportunity_id = db.Column(db.Integer, db.ForeignKey('archived_opportunities.id'), nullable=False, index=True)
+    
+    volunteer = db.relationship('User', lazy=True)
+    
+    def __repr__(self):
+        return f'<ArchivedApplication {self.id} - Status: {self.status}>'
+
+
+class Skill(db.Model):
+    """
+    A skill, shared by volunteer profiles and opportunities
+    """
+    __tablename__ = 'skills'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(50), nullable=False)  # As first entered, e.g. 'First Aid'
+    slug = db.Column(db.String(50), unique=True, nullable=False, index=True)  # Normalized, e.g. 'first aid'
+    
+    def __repr__(self):
+        return f'<Skill {self.name}>'
+
+
+class Place(db.Model):
+    """
+    Offline geocoding table: coordinates of known places, keyed by the
+    normalized name (e.g. 'austin, tx')
+    """
+    __tablename__ = 'places'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(120), unique=True, nullable=False, index=True)
+    latitude = db.Column(db.Float, nullable=False)
+    longitude = db.Column(db.Float, nullable=False)
+    
+    def __repr__(self):
+        return f'<Place {self.name}>'
+
+
+class SiteStats(db.Model):
+    """
+    Site-wide counters shown on the homepage, kept in a single row and
+    updated in the same transaction as the rows they count
+    """
+    __tablename__ = 'site_stats'
+    
+    ROW_ID = 1
+    
+    id = db.Column(db.Integer, primary_key=True)
+    open_opportunities = db.Column(db.Integer, nullable=False, default=0)
+    volunteers = db.Column(db.Integer, nullable=False, default=0)
+    organizations = db.Column(db.Integer, nullable=False, default=0)
+    
+    # Which counter a new user of each role adds to
+    ROLE_COUNTERS = {'volunteer': 'volunteers', 'organization': 'organizations'}
+    
+    @classmethod
+    def adjust(cls, **deltas):
+        """Atomically add to counters, e.g. adjust(open_opportunities=1)"""
+        values = {name: getattr(cls, name) + delta for name, delta in deltas.items()}
+        result = db.session.execute(db.update(cls).where(cls.id == cls.ROW_ID).values(values))
+        if result.rowcount == 0:
+            # First write (or the row was deleted): count everything instead
+            db.session.flush()
+            cls.rebuild()
+    
+    @classmethod
+    def rebuild(cls):
+        """Recount every counter from the source tables (caller commits)"""
+        # Concurrent first requests may both get here, so the row is created
+        # with an insert that ignores duplicates and then updated in place
+        db.session.execute(insert_ignoring_duplicates(cls.__table__).values(id=cls.ROW_ID))
+        db.session.execute(db.update(cls).where(cls.id == cls.ROW_ID).values(
+            open_opportunities=db.select(db.func.count(Opportunity.id))
+            .where(Opportunity.status == 'open').scalar_subquery(),
+            volunteers=db.select(db.func.count(User.id)).where(User.role == 'volunteer').scalar_subquery(),
+            organizations=db.select(db.func.count(User.id)).where(User.role == 'organization').scalar_subquery(),
+        ).execution_options(synchronize_session=False))
+        return db.session.get(cls, cls.ROW_ID, populate_existing=True)
+    
+    def __repr__(self):
+        return f'<SiteStats {self.open_opportunities} open, {self.volunteers} volunteers, {self.organizations} orgs>'
+
+
+class ApplicationDailyStats(db.Model):
+    """
+    Applications and decisions per opportunity and (UTC) day, kept up to
+    date by analytics.py so the dashboard trends never scan applications.
+    Rows outlive archiving, so opportunity_id may be an archived one.
+    """
+    __tablename__ = 'application_daily_stats'
+    
+    opportunity_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    day = db.Column(db.Date, primary_key=True)
+    org_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    applications = db.Column(db.Integer, nullable=False, default=0)  # Submitted that day
+    accepted = db.Column(db.Integer, nullable=False, default=0)  # Decided that day
+    rejected = db.Column(db.Integer, nullable=False, default=0)
+    # Decisions whose time is known (applications decided before decided_at
+    # was recorded count by their applied day, without a time)
+    timed_decisions = db.Column(db.Integer, nullable=False, default=0)
+    decision_seconds = db.Column(db.BigInteger, nullable=False, default=0)  # Applied to decided, summed
+    
+    __table_args__ = (db.Index('ix_application_daily_stats_org_id_day', 'org_id', 'day'),)
+    
+    def __repr__(self):
+        return f'<ApplicationDailyStats {self.opportunity_id} {self.day}>'
+
+
+class Job(db.Model):
+    """
+    Background job waiting to be run by the worker (see jobs.py)
+    """
+    __tablename__ = 'jobs'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    payload = db.Column(db.Text, nullable=False)  # JSON
+    status = db.Column(db.String(20), nullable=False, default='queued')  # 'queued', 'running' or 'failed'
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)  # Not before this time
+    locked_by = db.Column(db.String(100))  # Worker running it
+    locked_at = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    # The worker polls for the oldest due jobs of each status
+    __table_args__ = (db.Index('ix_jobs_status_run_at', 'status', 'run_at'),)
+    
+    def __repr__(self):
+        return f'<Job {self.id} {self.kind} - Status: {self.status}>'
+
+
+@contextmanager
+def schema_lock():
+    """Let one process on this host sync the schema at a time, e.g. gunicorn workers starting together"""
+    try:
+        import fcntl
+    except ImportError:  # No fcntl on Windows
+        yield
+        return
+    os.makedirs(current_app.instance_path, exist_ok=True)
+    with open(os.path.join(current_app.instance_path, 'schema.lock'), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+class SchemaUpgradeRequired(RuntimeError):
+    """The database is missing something ensure() can't add by itself"""
+
+
+class SchemaVersion(db.Model):
+    """
+    Fingerprint of the model definitions the database tables were last
+    brought up to date with, so startup can skip the schema sync when
+    nothing changed
+    """
+    __tablename__ = 'schema_version'
+    
+    ROW_ID = 1
+    
+    id = db.Column(db.Integer, primary_key=True)
+    fingerprint = db.Column(db.String(64), nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    # Run after every schema sync, for things create_all() doesn't create
+    SYNC_HOOKS = []
+    # name -> function; one-time data upgrades for databases created before them
+    UPGRADES = {}
+    
+    @classmethod
+    def after_sync(cls, function):
+        """Register a function to run whenever ensure() syncs the schema"""
+        cls.SYNC_HOOKS.append(function)
+        return function
+    
+    @classmethod
+    def upgrade(cls, name):
+        """
+        Register a one-time data upgrade. It runs (and commits) once on an
+        existing database; a database created after it is marked as done.
+        """
+        def register(function):
+            cls.UPGRADES[name] = function
+            return function
+        return register
+    
+    @classmethod
+    def current_fingerprint(cls):
+        """Hash of every table, column, key and index the models define, and the upgrades"""
+        parts = []
+        for name, table in sorted(db.metadata.tables.items()):
+            parts.append(name)
+            for column in table.columns:
+                foreign_keys = sorted(key.target_fullname for key in column.foreign_keys)
+                parts.append(f'{column.name} {column.type!r} {column.nullable} {column.primary_key} '
+                             f'{column.unique} {foreign_keys}')
+            parts.extend(sorted(f'{index.name} {[column.name for column in index.columns]} {index.unique}'
+                                for index in table.indexes))
+            parts.extend(sorted(f'{type(constraint).__name__} {constraint.name} {constraint.columns.keys()}'
+                                for constraint in table.constraints))
+        parts.extend(f'{function.__module__}.{function.__qualname__}' for function in cls.SYNC_HOOKS)
+        parts.extend(cls.UPGRADES)
+        return hashlib.sha256('\n'.join(parts).encode()).hexdigest()
+    
+    @staticmethod
+    def add_missing_columns(existing):
+        """
+        ALTER the tables in `existing` to add the columns and indexes the
+        models gained since they were created. Columns that are NOT NULL
+        without a server default can't be added to rows that already exist.
+        """
+        connection = db.session.connection()
+        inspector = inspect(connection)
+        preparer = connection.dialect.identifier_preparer
+        for table in db.metadata.sorted_tables:
+            if table.name not in existing:
+                continue
+            present = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in present:
+                    continue
+                if column.primary_key or (not column.nullable and column.server_default is None):
+                    raise SchemaUpgradeRequired(
+                        f'Schema upgrade required: add {table.name}.{column.name} by hand, '
+                        'it is NOT NULL without a server default'
+                    )
+                definition = CreateColumn(column).compile(dialect=connection.dialect)
+                connection.execute(text(f'ALTER TABLE {preparer.format_table(table)} ADD COLUMN {definition}'))
+            for index in table.indexes:
+                index.create(connection, checkfirst=True)
+        db.session.commit()
+    
+    @classmethod
+    def ensure(cls, force=False):
+        """
+        Bring the database up to date with the models unless it already is
+        (one primary-key read): create missing tables, add missing columns
+        and indexes, run the sync hooks and any pending upgrades. The
+        fingerprint is only recorded once all of that succeeded. Returns
+        True if the schema was synced.
+        """
+        fingerprint = cls.current_fingerprint()
+        if not force and cls.stored_fingerprint() == fingerprint:
+            return False
+        with schema_lock():
+            # Another process may have synced while this one waited
+            if not force and cls.stored_fingerprint() == fingerprint:
+                return False
+            cls.sync(fingerprint)
+        return True
+    
+    @classmethod
+    def stored_fingerprint(cls):
+        """The fingerprint the database was last synced with, or None"""
+        try:
+            row = db.session.get(cls, cls.ROW_ID, populate_existing=True)
+        except SQLAlchemyError:
+            db.session.rollback()  # No schema_version table yet
+            row = None
+        db.session.commit()
+        return row.fingerprint if row is not None else None
+    
+    @classmethod
+    def sync(cls, fingerprint):
+        """Make every change ensure() describes, then record the fingerprint"""
+        existing = set(inspect(db.engine).get_table_names())
+        # A new database has all the data upgrades built in
+        fresh = not existing & (set(db.metadata.tables) - {cls.__tablename__, SchemaUpgrade.__tablename__})
+        db.create_all()
+        cls.add_missing_columns(existing)
+        for hook in cls.SYNC_HOOKS:
+            hook()
+            db.session.commit()
+        
+        applied = set(db.session.scalars(db.select(SchemaUpgrade.name)))
+        for name, upgrade in cls.UPGRADES.items():
+            if name in applied:
+                continue
+            if not fresh:
+                upgrade()
+            db.session.add(SchemaUpgrade(name=name))
+            db.session.commit()
+        
+        row = db.session.get(cls, cls.ROW_ID) or cls(id=cls.ROW_ID)
+        row.fingerprint = fingerprint
+        db.session.add(row)
+        db.session.commit()
+    
+    def __repr__(self):
+        return f'<SchemaVersion {self.fingerprint[:12]}>'
+
+
+class SchemaUpgrade(db.Model):
+    """A one-time data upgrade (see SchemaVersion.upgrade) that has run"""
+    __tablename__ = 'schema_upgrades'
+    
+    name = db.Column(db.String(100), primary_key=True)
+    applied_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<SchemaUpgrade {self.name}>'
+
+
+# Create (and recount) the homepage counters row with the schema, not on a first request
+SchemaVersion.after_sync(SiteStats.rebuild)
@@ -0,0 +1,67 @@
+"""
+Email notifications about applications
+
+Routes only enqueue a small job per event. The worker sends them after
+NOTIFICATION_DELAY seconds, combining everything due for one recipient
+into a single email, so an organization triaging hundreds of applications
+doesn't flood its volunteers' inboxes or wait on SMTP.
+"""
+
+from flask import current_app
+from sqlalchemy.orm import joinedload
+from models import Application, Opportunity
+import jobs
+import mailer
+
+# event -> (who is told, line in the email)
+EVENTS = {
+    'received': ('organization', '{volunteer} applied for "{title}".'),
+    'accepted': ('volunteer', 'Your application for "{title}" was accepted!'),
+    'rejected': ('volunteer', 'Your application for "{title}" was not accepted this time.'),
+    'promoted': ('volunteer', 'A spot opened up for "{title}", so your application is now pending review.'),
+}
+
+# Notifications the worker sends per batch
+BATCH_SIZE = 500
+
+
+def notify(event, app_ids):
+    """Queue a notification about each application (sent once the caller commits)"""
+    if current_app.config['NOTIFICATIONS_ENABLED']:
+        jobs.enqueue('notify', [{'event': event, 'application_id': app_id} for app_id in app_ids],
+                     delay=current_app.config['NOTIFICATION_DELAY'])
+
+
+@jobs.handler('notify', batch_size=BATCH_SIZE)
+def send_notifications(batch):
+    """Send one email per recipient for a batch of notify jobs"""
+    app_ids = {payload['application_id'] for _, payload in batch}
+    applications = Application.query.options(
+        joinedload(Application.volunteer),
+        joinedload(Application.opportunity).joinedload(Opportunity.organization)
+    ).filter(Application.id.in_(app_ids)).all()
+    by_id = {application.id: application for application in applications}
+
+    # recipient ID -> (recipient, lines, job IDs)
+    digests = {}
+    for job_id, payload in batch:
+        application = by_id.get(payload['application_id'])
+        if application is None or payload['event'] not in EVENTS:
+            continue  # Deleted since: nothing to tell
+        audience, line = EVENTS[payload['event']]
+        recipient = application.opportunity.organization if audience == 'organization' else application.volunteer
+        digest = digests.setdefault(recipient.id, (recipient, [], []))
+        digest[1].append(line.format(volunteer=application.volunteer.name, title=application.opportunity.title))
+        digest[2].append(job_id)
+
+    config = current_app.config
+    messages = []
+    for recipient, lines, job_ids in digests.values():
+        subject = 'Update on Socio+' if len(lines) == 1 else f'{len(lines)} updates on Socio+'
+        body = f'Hi {recipient.name},\n\n' + '\n'.join(f'- {line}' for line in lines) + '\n\nThe Socio+ team\n'
+        messages.append((tuple(job_ids), mailer.build_message(config, recipient.email, subject, body)))
+
+    errors = {}
+    for job_ids, error in mailer.send_messages(config, messages).items():
+        errors.update(dict.fromkeys(job_ids, error))
+    return errors
@@ -0,0 +1,106 @@
+"""
+Password hashing off the request thread
+
+Hashes are computed in a bounded process pool so a login storm or a burst of
+registrations can't pin every web worker on CPU. When too many hashes are
+already queued, new requests fail fast with PasswordHasherBusy instead of
+stalling. A pool broken by a killed hashing process is replaced.
+"""
+
+import atexit
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from werkzeug.security import generate_password_hash, check_password_hash
+from metrics import record_password_hash
+
+
+class PasswordHasherBusy(Exception):
+    """Raised when the hashing queue is full"""
+
+
+class PasswordHasher:
+    """Hashes and verifies passwords using the method configured in Config"""
+
+    def __init__(self, app=None):
+        self.method = 'scrypt'
+        self.workers = 0
+        self.queue_limit = 0
+        self._method_prefix = None
+        self._pool = None
+        self._pool_pid = None
+        self._pool_lock = threading.Lock()
+        self._slots = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.method = app.config.get('PASSWORD_HASH_METHOD', 'scrypt')
+        self.workers = app.config.get('PASSWORD_HASH_WORKERS', 0)
+        self.queue_limit = app.config.get('PASSWORD_HASH_QUEUE_LIMIT', 32)
+        self._slots = threading.BoundedSemaphore(self.queue_limit) if self.queue_limit else None
+        self._method_prefix = None
+        app.extensions['password_hasher'] = self
+
+    def _get_pool(self):
+        # Pools don't survive fork, so each (pre)forked server worker gets its own
+        with self._pool_lock:
+            if self._pool is None or self._pool_pid != os.getpid():
+                self._pool = ProcessPoolExecutor(max_workers=self.workers)
+                self._pool_pid = os.getpid()
+                atexit.register(self._pool.shutdown, wait=False, cancel_futures=True)
+            return self._pool
+
+    def _discard_pool(self, pool):
+        """Drop a pool whose processes died, so the next call starts a new one"""
+        with self._pool_lock:
+            if self._pool is pool:
+                self._pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self, func, *args):
+        start = time.perf_counter()
+        try:
+            return self._call(func, *args)
+        finally:
+            record_password_hash(time.perf_counter() - start)
+
+    def _call(self, func, *args):
+        if not self.workers:
+            return func(*args)
+
+        if self._slots is not None and not self._slots.acquire(blocking=False):
+            raise PasswordHasherBusy('Too many password hashes queued')
+        try:
+            # A killed hashing process (e.g. by the OOM killer) breaks the
+            # whole pool; retry once on a new one, then shed the request
+            for _ in range(2):
+                pool = self._get_pool()
+                try:
+                    return pool.submit(func, *args).result()
+                except BrokenProcessPool:
+                    self._discard_pool(pool)
+            raise PasswordHasherBusy('Password hashing processes keep failing')
+        finally:
+            if self._slots is not None:
+                self._slots.release()
+
+    def hash(self, password):
+        """Hash a password with the configured method"""
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, pwhash, password):
+        """Check a password against a stored hash"""
+        return self._run(check_password_hash, pwhash, password)
+
+    def needs_rehash(self, pwhash):
+        """True when a stored hash was made with a different method or cost"""
+        if self._method_prefix is None:
+            # Werkzeug expands defaults, e.g. 'pbkdf2' is stored as 'pbkdf2:sha256:600000'
+            self._method_prefix = generate_password_hash('', self.method).split('$', 1)[0]
+        return pwhash.split('$', 1)[0] != self._method_prefix
+
+
+password_hasher = PasswordHasher()
@@ -0,0 +1,99 @@
+"""
+Queries shared by the HTML views and the JSON API
+"""
+
+from datetime import date
+from flask import request
+from sqlalchemy import func, and_, or_
+from sqlalchemy.orm import joinedload
+from models import db, Opportunity, Application, ArchivedOpportunity, ArchivedApplication
+
+
+def application_status_counts(*criteria):
+    """Count applications per status matching the given criteria"""
+    rows = db.session.query(
+        Application.status, func.count(Application.id)
+    ).join(Opportunity).filter(*criteria).group_by(Application.status).all()
+    return dict(rows)
+
+
+def archived_status_counts(*criteria):
+    """Count archived applications per status matching the given criteria"""
+    rows = db.session.query(
+        ArchivedApplication.status, func.count(ArchivedApplication.id)
+    ).join(ArchivedOpportunity).filter(*criteria).group_by(ArchivedApplication.status).all()
+    return dict(rows)
+
+
+def past_opportunities(org_id, limit):
+    """An organization's latest archived opportunities as (opportunity, applications, accepted)"""
+    applications = ArchivedApplication.query.with_entities(func.count(ArchivedApplication.id)).filter(
+        ArchivedApplication.opportunity_id == ArchivedOpportunity.id
+    )
+    rows = db.session.query(
+        ArchivedOpportunity,
+        applications.scalar_subquery(),
+        applications.filter(ArchivedApplication.status == 'accepted').scalar_subquery()
+    ).filter(ArchivedOpportunity.org_id == org_id).order_by(
+        ArchivedOpportunity.date.desc(), ArchivedOpportunity.id.desc()
+    ).limit(limit).all()
+    return [tuple(row) for row in rows]
+
+
+def past_applications(user_id, limit):
+    """A volunteer's latest archived applications, with their opportunity and organization"""
+    return ArchivedApplication.query.filter_by(user_id=user_id).options(
+        joinedload(ArchivedApplication.opportunity).joinedload(ArchivedOpportunity.organization)
+    ).order_by(ArchivedApplication.applied_at.desc(), ArchivedApplication.id.desc()).limit(limit).all()
+
+
+def parse_date(value):
+    """Parse a YYYY-MM-DD query string value into a date"""
+    return date.fromisoformat(value)
+
+
+def parse_cursor(value):
+    """Parse a browse page cursor of the form YYYY-MM-DD_<id>"""
+    cursor_date, _, cursor_id = value.partition('_')
+    return date.fromisoformat(cursor_date), int(cursor_id)
+
+
+def make_cursor(opportunity):
+    """Build the cursor pointing just past the given opportunity"""
+    return f'{opportunity.date.isoformat()}_{opportunity.id}'
+
+
+def browse_filters():
+    """Read the browse filters from the query string (invalid values are ignored)"""
+    return {
+        'location': request.args.get('location', '').strip(),
+        'from_date': request.args.get('from_date', type=parse_date),
+        'to_date': request.args.get('to_date', type=parse_date),
+        'org_id': request.args.get('org_id', type=int),
+    }
+
+
+def browse_open_opportunities(filters, cursor, limit, options=()):
+    """
+    One page of open opportunities in (date, id) order, starting after the
+    cursor. Keyset pagination seeks past the last (date, id) of the previous
+    page instead of using OFFSET, so every page is an index range scan.
+    """
+    query = Opportunity.query.filter_by(status='open')
+    if filters['from_date']:
+        query = query.filter(Opportunity.date >= filters['from_date'])
+    if filters['to_date']:
+        query = query.filter(Opportunity.date <= filters['to_date'])
+    if filters['org_id']:
+        query = query.filter(Opportunity.org_id == filters['org_id'])
+    if filters['location']:
+        query = query.filter(Opportunity.location.ilike(f"%{filters['location']}%"))
+    
+    if cursor:
+        cursor_date, cursor_id = cursor
+        query = query.filter(or_(
+            Opportunity.date > cursor_date,
+            and_(Opportunity.date == cursor_date, Opportunity.id > cursor_id)
+        ))
+    
+    return query.options(*options).order_by(Opportunity.date, Opportunity.id).limit(limit).all()
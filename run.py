@@ -1,30 +1,140 @@
 """
 Run script for Socio+ application
-This script initializes the database and starts the Flask server
+
+`python run.py` initializes the database and serves the app with gunicorn:
+preforked worker processes (threaded, or gevent with SERVER_WORKER_CLASS),
+each recycled after SERVER_MAX_REQUESTS requests. Worker and thread counts
+default to values derived from the CPUs available; with more than one
+worker the caches default to the shared filesystem backend. Signals to the
+master:
+
+    HUP    replace the workers gracefully (new code too if SERVER_PRELOAD is off)
+    USR2   start a new master with the new code; then TERM the old one
+    TERM   finish in-flight requests (up to SERVER_GRACEFUL_TIMEOUT), then exit
+
+`python run.py --dev` starts the Flask development server with the debugger.
 """
 
-from app import app, db
+import argparse
+import math
+import os
+from config import Config
+
+
+def available_cpus():
+    """CPUs this process may use, counting container CPU quotas (at least 1)"""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    # A container's CPU quota, e.g. 150000/100000 is one and a half CPUs
+    quota = _read_cgroup('/sys/fs/cgroup/cpu.max')  # cgroup v2: "<quota> <period>"
+    if quota is None:
+        quota = (_read_cgroup('/sys/fs/cgroup/cpu/cpu.cfs_quota_us') or []) + \
+            (_read_cgroup('/sys/fs/cgroup/cpu/cpu.cfs_period_us') or [])
+    if len(quota) == 2 and quota[0] not in ('max', '-1') and int(quota[1]) > 0:
+        cpus = min(cpus, math.ceil(int(quota[0]) / int(quota[1])))
+    return max(cpus, 1)
+
+
+def _read_cgroup(path):
+    try:
+        with open(path) as f:
+            return f.read().split()
+    except OSError:
+        return None
 
-def init_database():
-    """Create all database tables"""
+
+def server_options(config):
+    """gunicorn settings from the config, filling in CPU-based defaults"""
+    cpus = available_cpus()
+    worker_class = config.SERVER_WORKER_CLASS
+    options = {
+        'bind': config.SERVER_BIND,
+        'worker_class': worker_class,
+        'preload_app': config.SERVER_PRELOAD,
+        'max_requests': config.SERVER_MAX_REQUESTS,
+        'max_requests_jitter': config.SERVER_MAX_REQUESTS_JITTER,
+        'timeout': config.SERVER_TIMEOUT,
+        'graceful_timeout': config.SERVER_GRACEFUL_TIMEOUT,
+        'keepalive': config.SERVER_KEEPALIVE,
+        'accesslog': '-',
+        'errorlog': '-',
+    }
+    if worker_class == 'gevent':
+        # Each worker multiplexes many connections, so about one per CPU is enough
+        options['workers'] = config.SERVER_WORKERS or cpus + 1
+        options['worker_connections'] = config.SERVER_WORKER_CONNECTIONS
+    else:
+        # Requests mostly wait on the database, so keep a few threads per worker
+        options['workers'] = config.SERVER_WORKERS or 2 * cpus + 1
+        options['threads'] = config.SERVER_THREADS or 4
+    return options
+
+
+def init_database(app):
+    """Create the database tables, unless they are already up to date"""
+    from models import db, SchemaVersion
     with app.app_context():
-        db.create_all()
-        print("✓ Database initialized successfully!")
-        print("✓ Tables created: users, opportunities, applications")
+        if SchemaVersion.ensure():
+            print("✓ Database initialized successfully!")
+        else:
+            print("✓ Database schema is up to date")
+        # Workers forked from here must open their own connections
+        for engine in db.engines.values():
+            engine.dispose()
+
+
+def run_production():
+    from gunicorn.app.base import BaseApplication
+
+    class Server(BaseApplication):
+        def __init__(self, options):
+            self.options = options
+            super().__init__()
+
+        def load_config(self):
+            for key, value in self.options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            # In the master when preloading, otherwise in each worker
+            from app import app
+            init_database(app)
+            return app
+
+    options = server_options(Config)
+    if options['workers'] > 1 and not os.environ.get('CACHE_TYPE'):
+        # Per-worker caches would keep serving what another worker just changed
+        Config.CACHE_TYPE = 'filesystem'
+    print(f"Serving Socio+ on {options['bind']} with {options['workers']} {options['worker_class']} workers")
+    Server(options).run()
+
+
+def run_development():
+    from app import app
 
-if __name__ == '__main__':
     print("=" * 50)
     print("Starting Socio+ Application")
     print("=" * 50)
-    
+
     # Initialize database
-    init_database()
-    
+    init_database(app)
+
     print("\n" + "=" * 50)
     print("Server is running!")
     print("Open your browser and visit: http://127.0.0.1:5000")
     print("Press CTRL+C to stop the server")
     print("=" * 50 + "\n")
-    
+
     # Run the Flask development server
-    app.run(debug=True, host='127.0.0.1', port=5000)
\ No newline at end of file
+    app.run(debug=True, host='127.0.0.1', port=5000)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run the Socio+ web server.')
+    parser.add_argument('--dev', action='store_true', help='Use the Flask development server with the debugger.')
+    if parser.parse_args().dev:
+        run_development()
+    else:
+        run_production()
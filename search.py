@@ -0,0 +1,129 @@
+"""
+Full-text search over opportunity titles, descriptions and skills
+
+On SQLite the open opportunities are indexed in an FTS5 virtual table that
+is kept in sync from the routes that create opportunities or change their
+status. On MySQL a FULLTEXT index on the opportunities table itself is used,
+so it never needs syncing. Other backends fall back to a (slow) LIKE scan.
+"""
+
+import re
+from sqlalchemy import DDL, event, inspect, text, desc, or_
+from sqlalchemy.orm import joinedload
+from models import db, Opportunity, SchemaVersion
+
+FTS_TABLE = 'opportunities_fts'
+
+# Title matches weigh more than skills, which weigh more than the description
+FTS_WEIGHTS = (10.0, 1.0, 5.0)
+
+FULLTEXT_INDEX = 'ft_opportunities_search'
+
+create_fts_table = DDL(
+    f'CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} '
+    'USING fts5(title, description, skills_required)'
+)
+create_fulltext_index = DDL(
+    f'CREATE FULLTEXT INDEX {FULLTEXT_INDEX} '
+    'ON opportunities (title, description, skills_required)'
+)
+
+# Build the index alongside the opportunities table in db.create_all()
+# (ensure_index adds it to databases created before it existed)
+event.listen(Opportunity.__table__, 'after_create', create_fts_table.execute_if(dialect='sqlite'))
+event.listen(Opportunity.__table__, 'after_create', create_fulltext_index.execute_if(dialect='mysql'))
+
+
+def _dialect():
+    return db.engine.dialect.name
+
+
+def _fts_query(terms):
+    """Build an FTS5 MATCH expression requiring every term (as a prefix)"""
+    words = re.findall(r'\w+', terms)
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def sync_opportunities(opp_ids):
+    """
+    Bring the search index up to date for the given opportunity IDs.
+    Open opportunities are (re)indexed; anything else is removed.
+    Runs in the caller's transaction, so commit afterwards.
+    """
+    if _dialect() != 'sqlite' or not opp_ids:
+        return
+    opp_ids = list(opp_ids)
+    params = {f'id{i}': opp_id for i, opp_id in enumerate(opp_ids)}
+    id_list = ', '.join(f':{name}' for name in params)
+    db.session.execute(text(f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({id_list})'), params)
+    db.session.execute(text(
+        f'INSERT INTO {FTS_TABLE} (rowid, title, description, skills_required) '
+        f"SELECT id, title, description, COALESCE(skills_required, '') FROM opportunities "
+        f"WHERE id IN ({id_list}) AND status = 'open'"
+    ), params)
+
+
+def rebuild_index():
+    """Recreate the search index from scratch"""
+    if _dialect() != 'sqlite':
+        return
+    db.session.execute(text(f'DROP TABLE IF EXISTS {FTS_TABLE}'))
+    db.session.execute(create_fts_table)
+    db.session.execute(text(
+        f'INSERT INTO {FTS_TABLE} (rowid, title, description, skills_required) '
+        f"SELECT id, title, description, COALESCE(skills_required, '') FROM opportunities "
+        f"WHERE status = 'open'"
+    ))
+    db.session.commit()
+
+
+@SchemaVersion.after_sync
+def ensure_index():
+    """Create the search index if the database doesn't have it, filling it on SQLite"""
+    dialect = _dialect()
+    inspector = inspect(db.session.connection())
+    if dialect == 'sqlite' and not inspector.has_table(FTS_TABLE):
+        rebuild_index()
+    elif dialect == 'mysql':
+        if FULLTEXT_INDEX not in {index['name'] for index in inspector.get_indexes('opportunities')}:
+            db.session.execute(create_fulltext_index)
+
+
+def search_opportunities(terms, limit, offset=0):
+    """Return open opportunities matching the terms, best matches first"""
+    dialect = _dialect()
+
+    if dialect == 'sqlite':
+        match = _fts_query(terms)
+        if not match:
+            return []
+        rows = db.session.execute(text(
+            f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :match '
+            f'ORDER BY bm25({FTS_TABLE}, {", ".join(map(str, FTS_WEIGHTS))}) '
+            'LIMIT :limit OFFSET :offset'
+        ), {'match': match, 'limit': limit, 'offset': offset}).all()
+        ids = [row[0] for row in rows]
+        if not ids:
+            return []
+        found = Opportunity.query.options(joinedload(Opportunity.organization)).filter(
+            Opportunity.id.in_(ids), Opportunity.status == 'open'
+        ).all()
+        by_id = {opp.id: opp for opp in found}
+        return [by_id[opp_id] for opp_id in ids if opp_id in by_id]
+
+    query = Opportunity.query.options(joinedload(Opportunity.organization)).filter_by(status='open')
+
+    if dialect == 'mysql':
+        score = text(
+            'MATCH (title, description, skills_required) AGAINST (:terms IN NATURAL LANGUAGE MODE)'
+        ).bindparams(terms=terms)
+        query = query.filter(score).order_by(desc(score), Opportunity.id)
+    else:
+        pattern = f'%{terms}%'
+        query = query.filter(or_(
+            Opportunity.title.ilike(pattern),
+            Opportunity.description.ilike(pattern),
+            Opportunity.skills_required.ilike(pattern)
+        )).order_by(Opportunity.date, Opportunity.id)
+
+    return query.limit(limit).offset(offset).all()
@@ -0,0 +1,270 @@
+"""
+Seat accounting for opportunities
+
+Applying takes one of an opportunity's spots with a single conditional
+UPDATE, so concurrent applications can never oversell a listing and no row
+stays locked beyond the short write transaction. When the spots run out,
+applications join a waitlist (if enabled) and are promoted in order as
+rejections release seats. Every application and decision is also counted
+in the daily analytics rollups (see analytics.py) in the same transaction.
+"""
+
+from datetime import datetime
+from sqlalchemy import case, func, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from models import db, Opportunity, Application, SchemaVersion
+import analytics
+import notifications
+
+# Application statuses that hold one of the opportunity's spots
+SEAT_HOLDING = ('pending', 'accepted')
+
+
+def reserve_seat(opp_id):
+    """Take a spot if the opportunity is open and has one left"""
+    result = db.session.execute(
+        update(Opportunity)
+        .where(Opportunity.id == opp_id, Opportunity.status == 'open', Opportunity.spots_available > 0)
+        .values(spots_available=Opportunity.spots_available - 1)
+    )
+    return result.rowcount == 1
+
+
+def release_seats(opp_id, count=1):
+    """
+    Hand released spots to the oldest waitlisted applications, giving any
+    left over back to the opportunity. Returns the promoted application IDs.
+    """
+    promoted = []
+    while count > 0:
+        next_ids = db.session.scalars(
+            select(Application.id)
+            .where(Application.opportunity_id == opp_id, Application.status == 'waitlisted')
+            .order_by(Application.applied_at, Application.id)
+            .limit(count)
+        ).all()
+        if not next_ids:
+            db.session.execute(
+                update(Opportunity)
+                .where(Opportunity.id == opp_id)
+                .values(spots_available=Opportunity.spots_available + count)
+            )
+            break
+        # Another request may have promoted some first; then try the next ones
+        changed = update_statuses(next_ids, 'waitlisted', 'pending')
+        promoted.extend(changed)
+        count -= len(changed)
+    return promoted
+
+
+def _status_values(new_status, decided_at):
+    if new_status in analytics.DECIDED:
+        return {'status': new_status, 'decided_at': decided_at or datetime.utcnow()}
+    return {'status': new_status}
+
+
+def set_status(app_id, old_status, new_status, decided_at=None):
+    """Change an application's status only if it is still old_status"""
+    result = db.session.execute(
+        update(Application)
+        .where(Application.id == app_id, Application.status == old_status)
+        .values(_status_values(new_status, decided_at))
+    )
+    return result.rowcount == 1
+
+
+def update_statuses(app_ids, old_status, new_status, decided_at=None):
+    """
+    Change the status of the applications that are still old_status with
+    one UPDATE. Returns the IDs that changed: from RETURNING where the
+    database supports it, otherwise the rows must already be locked (see
+    decide_many) so all of them changed.
+    """
+    if not app_ids:
+        return []
+    statement = (
+        update(Application)
+        .where(Application.id.in_(app_ids), Application.status == old_status)
+        .values(_status_values(new_status, decided_at))
+        .execution_options(synchronize_session=False)
+    )
+    if db.session.get_bind().dialect.update_returning:
+        return db.session.scalars(statement.returning(Application.id)).all()
+    db.session.execute(statement)
+    return list(app_ids)
+
+
+def submit_application(opp_id, org_id, user_id, message, waitlist=True):
+    """
+    Reserve a spot, record the application, count it in the organization's
+    analytics and queue the organization's notification in one transaction
+    (committed here). Returns
+    (status, application ID): status is the new application's status
+    ('pending' or 'waitlisted'), 'duplicate' if the volunteer already
+    applied, 'closed' if the opportunity isn't open or 'full'; the ID is
+    None unless an application was recorded.
+    """
+    if reserve_seat(opp_id):
+        status = 'pending'
+    else:
+        # Only an open listing has a waitlist; the row lock (where the
+        # database has one) keeps it from closing until this commits
+        opp_status = db.session.scalar(
+            select(Opportunity.status).where(Opportunity.id == opp_id).with_for_update()
+        )
+        if opp_status != 'open' or not waitlist:
+            db.session.rollback()
+            return ('closed' if opp_status != 'open' else 'full'), None
+        status = 'waitlisted'
+
+    applied_at = datetime.utcnow()
+    try:
+        result = db.session.execute(insert(Application).values(
+            user_id=user_id,
+            opportunity_id=opp_id,
+            message=message,
+            status=status,
+            applied_at=applied_at
+        ))
+    except IntegrityError:
+        # Already applied: the rollback also returns the reserved spot
+        db.session.rollback()
+        return 'duplicate', None
+    application_id = result.inserted_primary_key[0]
+    analytics.record_application(opp_id, org_id, applied_at)
+    notifications.notify('received', [application_id])
+    db.session.commit()
+    return status, application_id
+
+
+def decide(application, action):
+    """
+    Accept or reject an application, moving its spot as needed (the caller
+    commits). Returns (status, promoted IDs): status is the new status,
+    'full' when a waitlisted application can't be accepted for lack of
+    spots, or None if nothing changed; promoted IDs are the waitlisted
+    applications that took a spot the rejection released.
+    """
+    old_status, old_decided_at = application.status, application.decided_at
+    decided_at = datetime.utcnow()
+    status, promoted = _decide(application, action, decided_at)
+    if status in analytics.DECIDED:
+        analytics.record_decisions([(application.opportunity_id, application.opportunity.org_id,
+                                     application.applied_at, old_status, old_decided_at, status)], decided_at)
+    return status, promoted
+
+
+def _decide(application, action, decided_at):
+    old_status = application.status
+
+    if action == 'accept':
+        if old_status == 'pending':
+            return ('accepted' if set_status(application.id, 'pending', 'accepted', decided_at) else None), []
+        if old_status == 'waitlisted':
+            if not reserve_seat(application.opportunity_id):
+                return 'full', []
+            if set_status(application.id, 'waitlisted', 'accepted', decided_at):
+                return 'accepted', []
+            db.session.rollback()
+            return None, []
+
+    elif action == 'reject':
+        if old_status in SEAT_HOLDING:
+            if set_status(application.id, old_status, 'rejected', decided_at):
+                return 'rejected', release_seats(application.opportunity_id)
+            return None, []
+        if old_status == 'waitlisted':
+            return ('rejected' if set_status(application.id, 'waitlisted', 'rejected', decided_at) else None), []
+
+    return None, []
+
+
+def decide_many(org_id, app_ids, action):
+    """
+    Accept or reject many of an organization's applications at once (the
+    caller commits). Ownership is checked with one joined query and each
+    status change is a single set-based UPDATE. Returns the changed
+    applications as {id: (opportunity_id, new status)}; waitlisted
+    volunteers promoted into released spots are included as 'pending'.
+    """
+    # Lock the rows where the database supports it, so the statuses read
+    # here are the ones the UPDATEs change
+    rows = db.session.execute(
+        select(Application.id, Application.opportunity_id, Application.status,
+               Application.applied_at, Application.decided_at)
+        .join(Opportunity)
+        .where(Application.id.in_(app_ids), Opportunity.org_id == org_id)
+        .with_for_update()
+    ).all()
+    rows_by_id = {row.id: row for row in rows}
+    opportunity_of = {row.id: row.opportunity_id for row in rows}
+    by_status = {}
+    for row in rows:
+        by_status.setdefault(row.status, []).append(row.id)
+
+    changed = {}
+    decided_at = datetime.utcnow()
+
+    def record(ids, status):
+        for app_id in ids:
+            changed[app_id] = (opportunity_of[app_id], status)
+
+    if action == 'accept':
+        record(update_statuses(by_status.get('pending', []), 'pending', 'accepted', decided_at), 'accepted')
+
+        # Waitlisted applications are accepted only while spots are left
+        reserved = []
+        full = set()
+        for app_id in by_status.get('waitlisted', []):
+            opp_id = opportunity_of[app_id]
+            if opp_id not in full:
+                if reserve_seat(opp_id):
+                    reserved.append(app_id)
+                else:
+                    full.add(opp_id)
+        accepted = update_statuses(reserved, 'waitlisted', 'accepted', decided_at)
+        record(accepted, 'accepted')
+        for app_id in set(reserved) - set(accepted):
+            release_seats(opportunity_of[app_id])
+
+    elif action == 'reject':
+        record(update_statuses(by_status.get('waitlisted', []), 'waitlisted', 'rejected', decided_at), 'rejected')
+
+        released = {}
+        for status in SEAT_HOLDING:
+            rejected = update_statuses(by_status.get(status, []), status, 'rejected', decided_at)
+            record(rejected, 'rejected')
+            for app_id in rejected:
+                released[opportunity_of[app_id]] = released.get(opportunity_of[app_id], 0) + 1
+        for opp_id, count in released.items():
+            for app_id in release_seats(opp_id, count):
+                changed[app_id] = (opp_id, 'pending')
+
+    decisions = []
+    for app_id, (opp_id, status) in changed.items():
+        if status in analytics.DECIDED:
+            row = rows_by_id[app_id]
+            decisions.append((opp_id, org_id, row.applied_at, row.status, row.decided_at, status))
+    analytics.record_decisions(decisions, decided_at)
+    return changed
+
+
+@SchemaVersion.upgrade('spots-left')
+def subtract_held_seats():
+    """
+    Turn spots_available into the spots left: before seats were reserved it
+    was the total, ignoring the pending and accepted applications
+    """
+    held = (
+        select(func.count(Application.id))
+        .where(Application.opportunity_id == Opportunity.id, Application.status.in_(SEAT_HOLDING))
+        .scalar_subquery()
+    )
+    db.session.execute(
+        update(Opportunity)
+        .where(Opportunity.spots_available.isnot(None))
+        .values(spots_available=case((Opportunity.spots_available > held, Opportunity.spots_available - held),
+                                     else_=0))
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
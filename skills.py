@@ -0,0 +1,252 @@
+"""
+Skills, volunteer skill profiles and opportunity recommendations
+
+Skills are normalized into their own table and linked to opportunities
+(parsed from skills_required) and volunteers. Each worker process keeps an
+inverted index from skill to open opportunities; a volunteer's
+recommendations are scored with NumPy over the postings of their skills
+(weighted by how rare each skill is), so top-N takes milliseconds. The
+index picks up new opportunities incrementally, drops closed ones as they
+are seen, and is rebuilt from scratch periodically.
+"""
+
+import math
+import re
+import threading
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import delete, insert, select
+from sqlalchemy.orm import joinedload
+from models import db, Opportunity, Skill, user_skills, opportunity_skills, insert_ignoring_duplicates
+
+MAX_SKILL_LENGTH = 50
+# Opportunities linked per statement when rebuilding links
+LINK_BATCH = 1000
+# How far before the last refresh each refresh looks again: an opportunity
+# created (and numbered) before it may only have been committed after it
+REFRESH_OVERLAP = timedelta(minutes=5)
+
+_SEPARATORS = re.compile(r'[,;/\n]')
+
+
+# ========== SKILLS ==========
+
+def parse_skills(text):
+    """{slug: display name} for a comma-separated skills string"""
+    parsed = {}
+    for part in _SEPARATORS.split(text or ''):
+        name = ' '.join(part.split())
+        if name and len(name) <= MAX_SKILL_LENGTH:
+            parsed.setdefault(name.lower(), name)
+    return parsed
+
+
+def skill_ids(names):
+    """IDs for {slug: name}, creating the skills that don't exist yet"""
+    if not names:
+        return {}
+    ids = dict(db.session.execute(select(Skill.slug, Skill.id).where(Skill.slug.in_(list(names)))).all())
+    missing = [{'slug': slug, 'name': name} for slug, name in names.items() if slug not in ids]
+    if missing:
+        # Another request may create some of them at the same time
+        db.session.execute(insert_ignoring_duplicates(Skill.__table__), missing)
+        ids = dict(db.session.execute(select(Skill.slug, Skill.id).where(Skill.slug.in_(list(names)))).all())
+    return ids
+
+
+def set_user_skills(user_id, text):
+    """Replace a volunteer's skills (caller commits)"""
+    ids = skill_ids(parse_skills(text))
+    db.session.execute(delete(user_skills).where(user_skills.c.user_id == user_id))
+    if ids:
+        db.session.execute(insert(user_skills), [{'user_id': user_id, 'skill_id': i} for i in ids.values()])
+
+
+def profile(user_id):
+    """A volunteer's skills as (ID, name) pairs"""
+    return db.session.execute(
+        select(Skill.id, Skill.name).join(user_skills, user_skills.c.skill_id == Skill.id)
+        .where(user_skills.c.user_id == user_id).order_by(Skill.name)
+    ).all()
+
+
+def link_opportunities(opp_ids):
+    """(Re)link opportunities to the skills in their skills_required (caller commits)"""
+    for start in range(0, len(opp_ids), LINK_BATCH):
+        rows = db.session.execute(
+            select(Opportunity.id, Opportunity.skills_required)
+            .where(Opportunity.id.in_(opp_ids[start:start + LINK_BATCH]))
+        ).all()
+        parsed = {row.id: parse_skills(row.skills_required) for row in rows}
+        names = {}
+        for skills in parsed.values():
+            names.update(skills)
+        ids = skill_ids(names)
+
+        db.session.execute(delete(opportunity_skills).where(
+            opportunity_skills.c.opportunity_id.in_([row.id for row in rows])))
+        links = [{'opportunity_id': opp_id, 'skill_id': ids[slug]}
+                 for opp_id, skills in parsed.items() for slug in skills]
+        if links:
+            db.session.execute(insert(opportunity_skills), links)
+
+
+def rebuild_opportunity_skills():
+    """Relink every opportunity from skills_required, a batch per commit"""
+    last_id = 0
+    total = 0
+    while True:
+        opp_ids = db.session.scalars(
+            select(Opportunity.id).where(Opportunity.id > last_id).order_by(Opportunity.id).limit(LINK_BATCH)
+        ).all()
+        if not opp_ids:
+            return total
+        link_opportunities(opp_ids)
+        db.session.commit()
+        last_id = opp_ids[-1]
+        total += len(opp_ids)
+
+
+# ========== RECOMMENDATIONS ==========
+
+class Recommender:
+    """Per-process inverted index from skills to open opportunities"""
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self._reset()
+        self.refresh_interval = 30
+        self.rebuild_interval = 3600
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.refresh_interval = app.config['RECOMMENDATION_REFRESH_INTERVAL']
+        self.rebuild_interval = app.config['RECOMMENDATION_REBUILD_INTERVAL']
+        app.extensions['recommender'] = self
+
+    def _reset(self):
+        self.built_at = None
+        self.refreshed_at = 0.0
+        self.scanned_at = None     # When the last scan started (UTC, like created_at)
+        self.opp_ids = []          # position -> opportunity ID
+        self.positions = {}        # opportunity ID -> position
+        self.skill_counts = []     # position -> number of skills
+        self.postings = {}         # skill ID -> [positions]
+        self.closed = set()        # positions of opportunities no longer open
+        self._arrays = None
+
+    def _add_rows(self, rows):
+        """Add (opportunity ID, skill ID) rows, ordered by opportunity ID, skipping indexed opportunities"""
+        added = set()
+        for opp_id, skill_id in rows:
+            position = self.positions.get(opp_id)
+            if position is None:
+                position = self.positions[opp_id] = len(self.opp_ids)
+                self.opp_ids.append(opp_id)
+                self.skill_counts.append(0)
+                added.add(opp_id)
+            elif opp_id not in added:
+                continue  # Seen by an earlier scan
+            self.skill_counts[position] += 1
+            self.postings.setdefault(skill_id, []).append(position)
+        if added:
+            self._arrays = None
+
+    def _open_links(self, created_since=None):
+        query = (
+            select(opportunity_skills.c.opportunity_id, opportunity_skills.c.skill_id)
+            .join(Opportunity, Opportunity.id == opportunity_skills.c.opportunity_id)
+            .where(Opportunity.status == 'open')
+            .order_by(opportunity_skills.c.opportunity_id)
+        )
+        if created_since is not None:
+            query = query.where(Opportunity.created_at >= created_since)
+        return db.session.execute(query).all()
+
+    def refresh(self, force=False):
+        """Rebuild when due, otherwise add opportunities created since the last refresh"""
+        now = time.monotonic()
+        if not force and self.built_at is not None and now - self.refreshed_at < self.refresh_interval:
+            return
+        with self._lock:
+            if not force and self.built_at is not None and now - self.refreshed_at < self.refresh_interval:
+                return  # Another thread just refreshed
+            scan_started = datetime.utcnow()
+            if self.built_at is None or now - self.built_at >= self.rebuild_interval:
+                self._reset()
+                self._add_rows(self._open_links())
+                self.built_at = now
+            else:
+                self._add_rows(self._open_links(self.scanned_at - REFRESH_OVERLAP))
+            self.scanned_at = scan_started
+            self.refreshed_at = now
+
+    def opportunities_created(self):
+        """Pick up new opportunities on the next recommendation"""
+        self.refreshed_at = 0.0
+
+    def opportunities_closed(self, opp_ids):
+        """Stop recommending opportunities that are no longer open"""
+        with self._lock:
+            closed = {self.positions[i] for i in opp_ids if i in self.positions}
+            if closed - self.closed:
+                self.closed |= closed
+                self._arrays = None
+
+    def _vectors(self):
+        """NumPy views of the index, rebuilt after changes"""
+        import numpy as np  # Imported on first use, keeping it out of app startup
+        arrays = self._arrays
+        if arrays is None:
+            with self._lock:
+                count = len(self.opp_ids)
+                norms = np.sqrt(np.maximum(np.array(self.skill_counts, dtype=np.float32), 1))
+                if self.closed:
+                    norms[list(self.closed)] = np.inf  # Scores of closed ones become 0
+                postings = {skill: np.array(positions, dtype=np.int64) for skill, positions in self.postings.items()}
+                # Rarer skills say more about a match
+                weights = {skill: math.log(1 + count / len(positions)) for skill, positions in self.postings.items()}
+                arrays = self._arrays = (np.array(self.opp_ids, dtype=np.int64), self.positions, norms,
+                                         postings, weights)
+        return arrays
+
+    def recommend(self, skill_ids, exclude=(), limit=6):
+        """Open opportunities best matching the skills, as [(opportunity, score)]"""
+        import numpy as np
+        if not skill_ids:
+            return []
+        self.refresh()
+        opp_ids, positions, norms, postings, weights = self._vectors()
+        if not len(opp_ids):
+            return []
+
+        scores = np.zeros(len(opp_ids), dtype=np.float32)
+        for skill_id in skill_ids:
+            if skill_id in postings:
+                scores[postings[skill_id]] += weights[skill_id]
+        scores /= norms
+        excluded = [positions[i] for i in exclude if positions.get(i, len(opp_ids)) < len(opp_ids)]
+        if excluded:
+            scores[excluded] = 0
+
+        # Oversample a little in case some top matches have closed since
+        wanted = limit * 2 + 5
+        candidates = np.flatnonzero(scores > 0)
+        if len(candidates) > wanted:
+            candidates = candidates[np.argpartition(-scores[candidates], wanted - 1)[:wanted]]
+        # Best score first, newest listing first among equal scores
+        candidates = candidates[np.lexsort((-opp_ids[candidates], -scores[candidates]))]
+        if not len(candidates):
+            return []
+
+        ranked = opp_ids[candidates].tolist()
+        found = {opp.id: opp for opp in Opportunity.query.options(joinedload(Opportunity.organization))
+                 .filter(Opportunity.id.in_(ranked), Opportunity.status == 'open')}
+        if len(found) < len(ranked):
+            self.opportunities_closed([i for i in ranked if i not in found])
+        scored = dict(zip(ranked, scores[candidates].tolist()))
+        return [(found[i], scored[i]) for i in ranked if i in found][:limit]
+
+
+recommender = Recommender()
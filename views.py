@@ -0,0 +1,523 @@
+"""
+Page views
+
+Routes are declared in app.py and point at these functions by name, so
+this module (and the forms and data modules it uses) is only imported
+when the first request that needs a page arrives.
+"""
+
+from datetime import date, datetime
+from flask import current_app, render_template, redirect, url_for, flash, request
+from flask_login import login_user, logout_user, login_required, current_user
+from sqlalchemy.orm import joinedload, selectinload
+from models import db, User, Opportunity, Application, ArchivedOpportunity, ArchivedApplication, SiteStats
+from forms import RegistrationForm, LoginForm, OpportunityForm, ApplicationForm, OpportunityImportForm, SkillsForm
+from queries import (application_status_counts, archived_status_counts, past_opportunities, past_applications,
+                     parse_cursor, make_cursor, browse_filters, browse_open_opportunities)
+from passwords import PasswordHasherBusy
+from database import use_primary
+from extensions import page_cache
+from skills import recommender
+import search
+import bulkdata
+import seats
+import notifications
+import geo
+import skills
+import analytics
+
+
+# ========== PUBLIC ROUTES ==========
+
+@page_cache.cached
+def index():
+    """Homepage"""
+    # Get statistics for homepage (one primary-key read of the counters row)
+    site_stats = db.session.get(SiteStats, SiteStats.ROW_ID)
+    if site_stats is None:
+        use_primary()  # Recounted and written on the primary
+        site_stats = SiteStats.rebuild()
+        db.session.commit()
+    
+    stats = {
+        'total_opportunities': site_stats.open_opportunities,
+        'total_volunteers': site_stats.volunteers,
+        'total_organizations': site_stats.organizations
+    }
+    
+    # Get 6 most recent opportunities
+    recent_opportunities = Opportunity.query.filter_by(status='open').options(
+        joinedload(Opportunity.organization)
+    ).order_by(
+        Opportunity.created_at.desc()
+    ).limit(6).all()
+    
+    return render_template('index.html', stats=stats, recent_opportunities=recent_opportunities)
+
+
+def register():
+    """User registration"""
+    if current_user.is_authenticated:
+        return redirect(url_for('index'))
+    
+    form = RegistrationForm()
+    if form.validate_on_submit():
+        # Create new user
+        user = User(
+            name=form.name.data,
+            email=form.email.data,
+            role=form.role.data,
+            phone=form.phone.data,
+            location=form.location.data
+        )
+        geo.locate(user)
+        try:
+            user.set_password(form.password.data)
+        except PasswordHasherBusy:
+            flash('We are handling a lot of sign-ups right now. Please try again in a moment.', 'warning')
+            return render_template('register.html', form=form), 503
+        
+        db.session.add(user)
+        SiteStats.adjust(**{SiteStats.ROLE_COUNTERS[user.role]: 1})
+        db.session.commit()
+        page_cache.invalidate()
+        
+        flash(f'Account created successfully! Welcome, {user.name}!', 'success')
+        login_user(user)
+        
+        # Redirect based on role
+        if user.role == 'volunteer':
+            return redirect(url_for('volunteer_dashboard'))
+        else:
+            return redirect(url_for('org_dashboard'))
+    
+    return render_template('register.html', form=form)
+
+
+def login():
+    """User login"""
+    if current_user.is_authenticated:
+        return redirect(url_for('index'))
+    
+    form = LoginForm()
+    if form.validate_on_submit():
+        user = User.query.filter_by(email=form.email.data).first()
+        
+        try:
+            password_ok = user is not None and user.check_password(form.password.data)
+        except PasswordHasherBusy:
+            flash('We are handling a lot of logins right now. Please try again in a moment.', 'warning')
+            return render_template('login.html', form=form), 503
+        
+        if password_ok:
+            # Upgrade hashes made with an outdated method or cost
+            # (if the hasher is busy, try again on the next login)
+            if user.password_needs_rehash():
+                try:
+                    user.set_password(form.password.data)
+                    db.session.commit()
+                except PasswordHasherBusy:
+                    pass
+            
+            login_user(user)
+            flash(f'Welcome back, {user.name}!', 'success')
+            
+            # Redirect to the page they were trying to access, or dashboard
+            next_page = request.args.get('next')
+            if next_page:
+                return redirect(next_page)
+            
+            if user.role == 'volunteer':
+                return redirect(url_for('volunteer_dashboard'))
+            else:
+                return redirect(url_for('org_dashboard'))
+        else:
+            flash('Invalid email or password. Please try again.', 'danger')
+    
+    return render_template('login.html', form=form)
+
+
+@login_required
+def logout():
+    """User logout"""
+    logout_user()
+    flash('You have been logged out successfully.', 'info')
+    return redirect(url_for('index'))
+
+
+@page_cache.cached
+def opportunities():
+    """Browse all opportunities"""
+    filters = browse_filters()
+    cursor = request.args.get('after', type=parse_cursor)
+    per_page = current_app.config['OPPORTUNITIES_PER_PAGE']
+    
+    # Fetch one extra row to know whether there is a next page
+    page = browse_open_opportunities(
+        filters, cursor, per_page + 1, options=[joinedload(Opportunity.organization)]
+    )
+    
+    next_cursor = make_cursor(page[per_page - 1]) if len(page) > per_page else None
+    
+    # Keep the active filters on pagination links
+    filter_args = {
+        key: value.isoformat() if isinstance(value, date) else value
+        for key, value in filters.items() if value
+    }
+    
+    return render_template(
+        'opportunities.html',
+        opportunities=page[:per_page],
+        filters=filter_args,
+        next_cursor=next_cursor,
+        is_first_page=cursor is None
+    )
+
+
+def search_opportunities():
+    """Full-text search over open opportunities"""
+    query = request.args.get('q', '').strip()
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = current_app.config['OPPORTUNITIES_PER_PAGE']
+    
+    results = []
+    if query:
+        # Fetch one extra row to know whether there is a next page
+        results = search.search_opportunities(query, limit=per_page + 1, offset=(page - 1) * per_page)
+    
+    return render_template(
+        'search.html',
+        query=query,
+        results=results[:per_page],
+        page=page,
+        has_next=len(results) > per_page
+    )
+
+
+def opportunities_near():
+    """Open opportunities within a radius of a place, nearest first"""
+    near = request.args.get('near', '').strip()
+    radius = min(max(request.args.get('radius', geo.DEFAULT_RADIUS_KM, type=int), 1), geo.MAX_RADIUS_KM)
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = current_app.config['OPPORTUNITIES_PER_PAGE']
+    
+    # Without a place, search around the logged-in user
+    if near:
+        coordinates = geo.geocode(near)
+    elif current_user.is_authenticated and current_user.latitude is not None:
+        coordinates = (current_user.latitude, current_user.longitude)
+    else:
+        coordinates = None
+    
+    results, total = [], 0
+    if coordinates:
+        results, total = geo.opportunities_near(*coordinates, radius, limit=per_page, offset=(page - 1) * per_page)
+    
+    return render_template(
+        'near.html',
+        near=near,
+        radius=radius,
+        radius_choices=geo.RADIUS_CHOICES_KM,
+        located=coordinates is not None,
+        results=results,
+        total=total,
+        page=page,
+        has_next=page * per_page < total
+    )
+
+
+@page_cache.cached
+def opportunity_detail(opp_id):
+    """View opportunity details and apply"""
+    opportunity = Opportunity.query.get_or_404(opp_id)
+    form = ApplicationForm()
+    
+    # Check if user has already applied
+    has_applied = False
+    application_status = None
+    
+    if current_user.is_authenticated and current_user.role == 'volunteer':
+        existing_app = Application.query.filter_by(
+            user_id=current_user.id,
+            opportunity_id=opp_id
+        ).first()
+        
+        if existing_app:
+            has_applied = True
+            application_status = existing_app.status
+    
+    return render_template(
+        'opportunity_detail.html',
+        opportunity=opportunity,
+        form=form,
+        has_applied=has_applied,
+        application_status=application_status
+    )
+
+
+# ========== VOLUNTEER ROUTES ==========
+
+@login_required
+def volunteer_dashboard():
+    """Volunteer dashboard"""
+    if current_user.role != 'volunteer':
+        flash('Access denied. Volunteers only.', 'danger')
+        return redirect(url_for('index'))
+    
+    # Get all applications by this volunteer, with each opportunity and its
+    # organization joined in so the template doesn't lazy load per row
+    applications = Application.query.filter_by(user_id=current_user.id).options(
+        joinedload(Application.opportunity).joinedload(Opportunity.organization)
+    ).order_by(
+        Application.applied_at.desc()
+    ).all()
+    
+    # Calculate statistics with a single GROUP BY on status, plus one over
+    # the applications to archived opportunities
+    status_counts = application_status_counts(Application.user_id == current_user.id)
+    archived_counts = archived_status_counts(ArchivedApplication.user_id == current_user.id)
+    accepted_count = status_counts.get('accepted', 0) + archived_counts.get('accepted', 0)
+    pending_count = status_counts.get('pending', 0)
+    history = past_applications(current_user.id, current_app.config['DASHBOARD_HISTORY_LIMIT'])
+    
+    # Open opportunities matching the volunteer's skills, from the in-memory index
+    profile_skills = skills.profile(current_user.id)
+    recommendations = recommender.recommend(
+        [skill_id for skill_id, _ in profile_skills],
+        exclude={application.opportunity_id for application in applications},
+        limit=current_app.config['RECOMMENDATIONS_LIMIT']
+    )
+    skills_form = SkillsForm(skills=', '.join(name for _, name in profile_skills))
+    
+    return render_template(
+        'volunteer_dashboard.html',
+        applications=applications,
+        total_count=len(applications) + sum(archived_counts.values()),
+        accepted_count=accepted_count,
+        pending_count=pending_count,
+        history=history,
+        recommendations=recommendations,
+        skills_form=skills_form
+    )
+
+
+@login_required
+def update_skills():
+    """Replace the volunteer's skill profile"""
+    if current_user.role != 'volunteer':
+        flash('Access denied. Volunteers only.', 'danger')
+        return redirect(url_for('index'))
+    
+    form = SkillsForm()
+    if form.validate_on_submit():
+        skills.set_user_skills(current_user.id, form.skills.data)
+        db.session.commit()
+        flash('Your skills have been updated.', 'success')
+    else:
+        flash('Could not update your skills. Please try again.', 'danger')
+    return redirect(url_for('volunteer_dashboard'))
+
+
+@login_required
+def apply(opp_id):
+    """Submit application for an opportunity"""
+    if current_user.role != 'volunteer':
+        flash('Only volunteers can apply to opportunities.', 'danger')
+        return redirect(url_for('opportunity_detail', opp_id=opp_id))
+    
+    opportunity = Opportunity.query.get_or_404(opp_id)
+    
+    if opportunity.status != 'open':
+        flash('This opportunity is currently closed for applications.', 'warning')
+        return redirect(url_for('opportunity_detail', opp_id=opp_id))
+    
+    form = ApplicationForm()
+    if form.validate_on_submit():
+        user_id = current_user.id
+        org_id = opportunity.org_id
+        # End the read transaction so the seat reservation runs as its own
+        # short write transaction
+        db.session.commit()
+        
+        # Duplicate applications are rejected by the unique constraint
+        status, _ = seats.submit_application(opp_id, org_id, user_id, form.message.data,
+                                                          waitlist=current_app.config['APPLICATION_WAITLIST'])
+        if status == 'duplicate':
+            flash('You have already applied to this opportunity.', 'warning')
+            return redirect(url_for('opportunity_detail', opp_id=opp_id))
+        if status == 'full':
+            flash('Sorry, all spots for this opportunity have been filled.', 'warning')
+            return redirect(url_for('opportunity_detail', opp_id=opp_id))
+        if status == 'closed':
+            flash('This opportunity is currently closed for applications.', 'warning')
+            return redirect(url_for('opportunity_detail', opp_id=opp_id))
+        
+        page_cache.invalidate()
+        if status == 'waitlisted':
+            flash('All spots are taken, so you have been added to the waitlist.', 'info')
+        else:
+            flash('Application submitted successfully!', 'success')
+        return redirect(url_for('volunteer_dashboard'))
+    
+    flash('Error submitting application. Please try again.', 'danger')
+    return redirect(url_for('opportunity_detail', opp_id=opp_id))
+
+
+# ========== ORGANIZATION ROUTES ==========
+
+@login_required
+def org_dashboard():
+    """Organization dashboard"""
+    if current_user.role != 'organization':
+        flash('Access denied. Organizations only.', 'danger')
+        return redirect(url_for('index'))
+    
+    # Get all opportunities posted by this organization, eager loading the
+    # applications and their volunteers in one extra query each
+    opportunities = Opportunity.query.filter_by(org_id=current_user.id).options(
+        selectinload(Opportunity.applications).joinedload(Application.volunteer)
+    ).order_by(
+        Opportunity.created_at.desc()
+    ).all()
+    
+    # Calculate statistics with a single GROUP BY on status, plus one over
+    # the applications to archived opportunities
+    status_counts = application_status_counts(Opportunity.org_id == current_user.id)
+    archived_counts = archived_status_counts(ArchivedOpportunity.org_id == current_user.id)
+    total_applications = sum(status_counts.values()) + sum(archived_counts.values())
+    pending_applications = status_counts.get('pending', 0)
+    
+    # Archived opportunities: how many, and the latest with their application counts
+    archived_count = db.session.query(db.func.count(ArchivedOpportunity.id)).filter(
+        ArchivedOpportunity.org_id == current_user.id
+    ).scalar()
+    history = past_opportunities(current_user.id, current_app.config['DASHBOARD_HISTORY_LIMIT'])
+    
+    # Trends from the daily rollups, never the application history
+    stats = analytics.summary(current_user.id, datetime.utcnow().date(), current_app.config['ANALYTICS_DAYS'],
+                              current_app.config['ANALYTICS_TOP_OPPORTUNITIES'])
+    titles = {opp.id: opp.title for opp, _, _ in history}
+    titles.update((opp.id, opp.title) for opp in opportunities)
+    
+    return render_template(
+        'org_dashboard.html',
+        opportunities=opportunities,
+        posted_count=len(opportunities) + archived_count,
+        total_applications=total_applications,
+        pending_applications=pending_applications,
+        history=history,
+        archived_count=archived_count,
+        analytics=stats,
+        titles=titles
+    )
+
+
+@login_required
+def create_opportunity():
+    """Create a new volunteer opportunity"""
+    if current_user.role != 'organization':
+        flash('Only organizations can post opportunities.', 'danger')
+        return redirect(url_for('index'))
+    
+    form = OpportunityForm()
+    if form.validate_on_submit():
+        opportunity = Opportunity(
+            title=form.title.data,
+            description=form.description.data,
+            location=form.location.data,
+            date=form.date.data,
+            duration=form.duration.data,
+            skills_required=form.skills_required.data,
+            spots_available=form.spots_available.data,
+            org_id=current_user.id,
+            status='open'
+        )
+        geo.locate(opportunity)
+        
+        db.session.add(opportunity)
+        db.session.flush()
+        search.sync_opportunities([opportunity.id])
+        skills.link_opportunities([opportunity.id])
+        SiteStats.adjust(open_opportunities=1)
+        db.session.commit()
+        recommender.opportunities_created()
+        page_cache.invalidate()
+        
+        flash('Opportunity posted successfully!', 'success')
+        return redirect(url_for('org_dashboard'))
+    
+    return render_template('create_opportunity.html', form=form)
+
+
+@login_required
+def import_opportunities():
+    """Import many opportunities from an uploaded CSV or JSONL file"""
+    if current_user.role != 'organization':
+        flash('Only organizations can post opportunities.', 'danger')
+        return redirect(url_for('index'))
+    
+    form = OpportunityImportForm()
+    if form.validate_on_submit():
+        upload = form.file.data
+        fmt = upload.filename.rsplit('.', 1)[-1].lower()
+        imported, errors = bulkdata.import_opportunities(
+            bulkdata.text_stream(upload.stream), fmt, current_user.id
+        )
+        if imported:
+            page_cache.invalidate()
+        
+        flash(f'Imported {imported} opportunities.', 'success' if imported else 'warning')
+        for line_num, error in errors:
+            flash(f'Line {line_num} skipped: {error}', 'danger')
+        return redirect(url_for('org_dashboard'))
+    
+    return render_template('import_opportunities.html', form=form, fields=bulkdata.IMPORT_FIELDS)
+
+
+@login_required
+def update_application(app_id):
+    """Accept or reject an application"""
+    if current_user.role != 'organization':
+        flash('Access denied.', 'danger')
+        return redirect(url_for('index'))
+    
+    application = Application.query.get_or_404(app_id)
+    
+    # Verify the organization owns this opportunity
+    if application.opportunity.org_id != current_user.id:
+        flash('Access denied.', 'danger')
+        return redirect(url_for('org_dashboard'))
+    
+    action = request.form.get('action')
+    # Conditional updates keep the spot count right if two requests race
+    status, promoted = seats.decide(application, action)
+    
+    if status == 'accepted':
+        flash('Application accepted!', 'success')
+    elif status == 'rejected':
+        flash('Application rejected.', 'info')
+    elif status == 'full':
+        flash('No spots left to accept this application.', 'warning')
+        return redirect(url_for('org_dashboard'))
+    else:
+        return redirect(url_for('org_dashboard'))
+    
+    # Sent by the worker once this commits
+    notifications.notify(status, [application.id])
+    notifications.notify('promoted', promoted)
+    db.session.commit()
+    page_cache.invalidate()
+    return redirect(url_for('org_dashboard'))
+
+
+# ========== ERROR HANDLERS ==========
+
+def page_not_found(e):
+    """404 error handler"""
+    return render_template('base.html'), 404
+
+
+def internal_server_error(e):
+    """500 error handler"""
+    db.session.rollback()
+    return render_template('base.html'), 500